@@ -4,13 +4,15 @@ import backtrader as bt
 import math
 
 # 计算交易
+# 胜率、盈亏比等均为累加量；capture=True 时才保存每笔已平仓的 Trade 对象
 class CustomTradeAnalyzer(bt.Analyzer):
     params = (
         ('num_years', 1.0),
+        ('capture', False),
     )
 
     def start(self):
-        self.trades = []
+        self.trades = [] if self.p.capture else None
         self.total_trades = 0
         self.winning_trades = 0
         self.total_profit = 0
@@ -28,7 +30,8 @@ class CustomTradeAnalyzer(bt.Analyzer):
             else:
                 self.total_loss -= trade.pnl  # 注意：亏损的trade.pnl是负数
 
-            self.trades.append(trade)
+            if self.trades is not None:
+                self.trades.append(trade)
 
     def stop(self):
         self.annual_trade_count = self.total_trades / self.p.num_years
@@ -54,27 +57,58 @@ class CustomTradeAnalyzer(bt.Analyzer):
 
 
 # 计算收益
+# 逐K线收益的均值、方差（Welford）与下行平方和在线累加，内存 O(1)，据此给出年化的夏普 / 索提诺比率（无风险利率按 0）；
+# capture=True 时才保存每根K线的累计收益序列，供报告或绘图使用
 class CustomReturns(bt.Analyzer):
-    params = (('num_years', 1.0),)  
+    params = (
+        ('num_years', 1.0),
+        ('capture', False),
+    )
 
     def start(self):
         self.start_value = self.strategy.broker.getvalue()
         self.current_value = self.start_value
-        self.returns = []
+        self.returns = [] if self.p.capture else None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
 
     def next(self):
+        previous_value = self.current_value
         self.current_value = self.strategy.broker.getvalue()
-        returns = (self.current_value / self.start_value) - 1.0
-        self.returns.append(returns)
+        bar_return = self.current_value / previous_value - 1.0
+
+        self.count += 1
+        delta = bar_return - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (bar_return - self.mean)
+        if bar_return < 0:
+            self.downside_sq += bar_return * bar_return
+
+        if self.returns is not None:
+            self.returns.append((self.current_value / self.start_value) - 1.0)
 
     def stop(self):
         self.roi = (self.current_value / self.start_value) - 1.0
-        self.annualized_roi = math.pow(1.0 + self.roi, 1 / self.params.num_years) - 1.0
+        # 回测不足一天时 num_years 为 0，与 metrics.analyze 相同按 0 处理
+        self.annualized_roi = math.pow(1.0 + self.roi, 1 / self.params.num_years) - 1.0 if self.params.num_years > 0 else 0
+
+        # 按实际K线数折算每年的K线根数
+        bars_per_year = self.count / self.p.num_years if self.p.num_years > 0 else self.count
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+        downside = math.sqrt(self.downside_sq / self.count) if self.count else 0.0
+        self.volatility = std * math.sqrt(bars_per_year)
+        self.sharpe = self.mean / std * math.sqrt(bars_per_year) if std > 0 else 0.0
+        self.sortino = self.mean / downside * math.sqrt(bars_per_year) if downside > 0 else 0.0
 
     def get_analysis(self):
         return {
             'roi': self.roi,
             'annualized_roi': self.annualized_roi,
+            'volatility': self.volatility,
+            'sharpe': self.sharpe,
+            'sortino': self.sortino,
         }
 
 
@@ -0,0 +1,272 @@
+# benchmark.py
+# 回测热点路径的基准测试：对每个策略、每份数据（处理后的 qqq 数据 + 不同长度的合成数据）
+# 分阶段计时并记录内存峰值，结果写成 JSON；指定基准文件时逐项对比，超出容差即判为退化并以非零状态退出。
+# 阶段：
+#   csv_load     直接解析 CSV
+#   load         经 datastore 缓存加载
+#   precompute   指标整列预计算（开启 precompute_indicators 时）
+#   feed         构建数据源并预加载到 backtrader
+#   run          cerebro.run() 整体，其中 indicators / recorder / analyzers 为其内部各部分的累计耗时
+#   export       生成逐K线记录并写出 CSV
+# 时间取 repeat 次中的最小值；内存峰值（tracemalloc）另跑一遍单独测量，避免拖慢计时。
+# 默认只跑较小的合成数据，几分钟内完成，用作日常回归检查；--large 时追加 large_sizes（百万、千万根K线），每个只计时 large_repeat 次
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import functools
+import tracemalloc
+import subprocess
+import numpy as np
+import pandas as pd
+import backtrader as bt
+from config import CONFIG
+import strategy as strategy_module
+from strategy import TradeRecorder
+from indicators import precompute_indicators, indicator_column
+from datastore import ensure_cache
+from feeds import indicator_feed_class
+from writers import filter_trades
+from synthetic import synthetic_file
+from main import run_strategy, get_metrics, load_data, strategy_specs, ensure_dir
+
+# run 阶段内部计时的方法：(阶段, 类, 方法名)
+RUN_PARTS = [
+    ('indicators', cls, method)
+    for cls in (strategy_module.VolumeWeightedMovingAverage, strategy_module.OnlineStandardDeviation,
+                strategy_module.PrecomputedLine)
+    for method in ('prenext', 'next', 'once')
+] + [
+    ('recorder', TradeRecorder, 'record'),
+] + [
+    ('analyzers', bt.Analyzer, method)
+    for method in ('_start', '_prenext', '_nextstart', '_next', '_notify_cashvalue', '_notify_fund',
+                   '_notify_order', '_notify_trade', '_stop')
+]
+FEED_PARTS = [('feed', bt.feed.AbstractDataBase, 'preload')]
+
+
+# 临时替换类方法，累计各阶段耗时；同一阶段嵌套调用（如分析器的子分析器）只计最外层
+@contextlib.contextmanager
+def timed_methods(parts, totals):
+    depth = {stage: 0 for stage, _, _ in parts}
+    patched = []
+
+    def wrap(stage, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if depth[stage]:
+                return method(*args, **kwargs)
+            depth[stage] += 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                totals[stage] = totals.get(stage, 0.0) + time.perf_counter() - start
+                depth[stage] -= 1
+        return wrapper
+
+    for stage, cls, name in parts:
+        own = name in vars(cls)
+        method = getattr(cls, name, None)
+        if method is None:
+            continue
+        patched.append((cls, name, own, vars(cls).get(name)))
+        setattr(cls, name, wrap(stage, method))
+    try:
+        yield totals
+    finally:
+        for cls, name, own, original in reversed(patched):
+            if own:
+                setattr(cls, name, original)
+            else:
+                delattr(cls, name)
+
+
+# 计时并（可选）记录内存峰值
+@contextlib.contextmanager
+def measure(stages, name, memory):
+    if memory:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = {'seconds': time.perf_counter() - start}
+        if memory:
+            stages[name]['peak_mb'] = (tracemalloc.get_traced_memory()[1] - base) / 2 ** 20
+
+
+# 一次完整回测的各阶段耗时，返回 (K线数, 各阶段结果)
+def run_once(strategy_name, data_file, timeframe, params, memory=False):
+    stages = {}
+    specs = strategy_specs(strategy_name, params)
+
+    if memory:
+        tracemalloc.start()
+    try:
+        with measure(stages, 'csv_load', memory):
+            pd.read_csv(data_file, index_col='datetime', parse_dates=True)
+        with measure(stages, 'load', memory):
+            data = load_data(data_file)
+        if specs:
+            with measure(stages, 'precompute', memory):
+                data = precompute_indicators(data, specs)
+
+        parts = {}
+        with measure(stages, 'run', memory), timed_methods(FEED_PARTS + RUN_PARTS, parts):
+            feed_class = indicator_feed_class(tuple(indicator_column(spec) for spec in specs))
+            start = time.perf_counter()
+            data_feed = feed_class(dataname=data)
+            parts['feed'] = time.perf_counter() - start
+            with contextlib.redirect_stdout(io.StringIO()):
+                cerebro, results, num_years = run_strategy(data_file, strategy_name, params, data_feed=data_feed,
+                                                           timeframe=timeframe)
+            start = time.perf_counter()
+            get_metrics(results)
+            parts['analyzers'] = parts.get('analyzers', 0.0) + time.perf_counter() - start
+        # 数据源预加载在 cerebro.run() 内，从 run 中扣除后单列为 feed 阶段
+        stages['feed'] = {'seconds': parts.pop('feed', 0.0)}
+        stages['run']['seconds'] -= stages['feed']['seconds']
+        for part in ('indicators', 'recorder', 'analyzers'):
+            stages[part] = {'seconds': parts.get(part, 0.0)}
+
+        with measure(stages, 'export', memory), tempfile.TemporaryDirectory() as directory:
+            df = results[0].trade_recorder.get_analysis()
+            df.to_csv(os.path.join(directory, 'all_trades.csv'), encoding='utf-8-sig')
+            filter_trades(df).to_csv(os.path.join(directory, 'trades.csv'), encoding='utf-8-sig')
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+    return len(data), stages
+
+
+# 多次计时取最小值，内存峰值另跑一遍
+def benchmark_case(strategy_name, data_file, timeframe, params, repeat=3, memory=True):
+    ensure_cache(data_file)
+    runs = [run_once(strategy_name, data_file, timeframe, params) for _ in range(repeat)]
+    bars = runs[0][0]
+    stages = {name: {'seconds': min(run[name]['seconds'] for _, run in runs)} for name in runs[0][1]}
+    if memory:
+        _, traced = run_once(strategy_name, data_file, timeframe, params, memory=True)
+        for name, values in traced.items():
+            if 'peak_mb' in values:
+                stages[name]['peak_mb'] = values['peak_mb']
+    return bars, stages
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'backtrader': bt.__version__,
+        'precompute_indicators': bool(CONFIG.get('precompute_indicators')),
+    }
+
+
+# 数据集列表：(名称, 文件, 时间框架, 计时次数)
+def benchmark_datasets(sizes, repeat=3, large_sizes=(), large_repeat=1, seed=0):
+    datasets = [(name, file_path, name.split('_')[-1], repeat) for name, file_path in CONFIG['data_files'].items()]
+    datasets += [(f'synthetic_{bars}', synthetic_file(bars, seed), '5min', repeat) for bars in sizes]
+    datasets += [(f'synthetic_{bars}', synthetic_file(bars, seed), '5min', large_repeat) for bars in large_sizes]
+    return datasets
+
+
+def run_benchmark(sizes, repeat=3, memory=True, strategies=None, large_sizes=(), large_repeat=1):
+    cases = []
+    for name, data_file, timeframe, times in benchmark_datasets(sizes, repeat, large_sizes, large_repeat):
+        for strategy_name, strategy_config in CONFIG['strategies'].items():
+            if strategies and strategy_name not in strategies:
+                continue
+            params = (strategy_config['params'] or {}).get(timeframe, {})
+            print(f"{strategy_name} / {name} ...", flush=True)
+            bars, stages = benchmark_case(strategy_name, data_file, timeframe, params, times, memory)
+            cases.append({'strategy': strategy_name, 'dataset': name, 'bars': bars, 'stages': stages})
+    return {'environment': environment(), 'cases': cases}
+
+
+# 与基准结果逐项对比：耗时或内存峰值超过基准 (1 + tolerance) 倍且差值超过噪声下限时记为退化
+def compare(report, baseline, tolerance=0.2, min_seconds=0.05, min_mb=1.0):
+    base_cases = {(case['strategy'], case['dataset']): case['stages'] for case in baseline['cases']}
+    regressions = []
+    for case in report['cases']:
+        base_stages = base_cases.get((case['strategy'], case['dataset']))
+        if base_stages is None:
+            continue
+        for stage, values in case['stages'].items():
+            base = base_stages.get(stage)
+            if base is None:
+                continue
+            for key, floor in (('seconds', min_seconds), ('peak_mb', min_mb)):
+                if key not in values or key not in base:
+                    continue
+                if values[key] > base[key] * (1 + tolerance) and values[key] - base[key] > floor:
+                    regressions.append({
+                        'strategy': case['strategy'], 'dataset': case['dataset'], 'stage': stage,
+                        'metric': key, 'baseline': base[key], 'current': values[key],
+                    })
+    return regressions
+
+
+def print_report(report):
+    rows = []
+    for case in report['cases']:
+        row = {'策略': case['strategy'], '数据': case['dataset'], 'K线数': case['bars']}
+        row.update({stage: values['seconds'] for stage, values in case['stages'].items()})
+        rows.append(row)
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+
+
+def main():
+    settings = CONFIG['benchmark']
+    parser = argparse.ArgumentParser(description='回测热点路径基准测试')
+    parser.add_argument('--sizes', type=int, nargs='*', default=settings['sizes'], help='合成数据的K线数')
+    parser.add_argument('--repeat', type=int, default=settings['repeat'])
+    parser.add_argument('--large', action='store_true', help='追加 large_sizes 的大规模合成数据（耗时较长）')
+    parser.add_argument('--strategies', nargs='*', default=None)
+    parser.add_argument('--no-memory', action='store_true', help='不测量内存峰值')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径')
+    parser.add_argument('--baseline', default=settings.get('baseline'), help='用于对比的基准 JSON')
+    parser.add_argument('--tolerance', type=float, default=settings['tolerance'])
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.repeat, settings['memory'] and not args.no_memory, args.strategies,
+                           settings['large_sizes'] if args.large else (), settings['large_repeat'])
+    print_report(report)
+
+    output_file = args.output or f"{CONFIG['output_dir']}benchmark/benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    ensure_dir(output_file)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n基准测试结果已保存到: {output_file}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n相对 {args.baseline} 的性能退化：")
+            print(pd.DataFrame(regressions).to_string(index=False))
+            sys.exit(1)
+        print(f"\n与 {args.baseline} 相比未发现性能退化")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# cache.py
+# 回测结果缓存：以 (策略类源码, 共用代码源码, 时间框架, 参数, friction_cost, initial_cash, 影响结果的配置,
+# 数据内容哈希) 的 sha256 为键，保存一次回测的分析结果与逐K线记录（交易记录、可视化数据都由它生成）。
+# 输入不变时直接取用，只改了一个策略时其余策略不再重跑。条目按最近使用时间淘汰，总大小不超过 max_size_mb。
+# 共用代码为 SHARED_MODULES 整个模块、strategy.py 中的 SHARED_OBJECTS 与 main 中汇总指标的函数；
+# 此外的代码（如 backtrader 本身）改动不会使缓存失效，此时需手动清空：python cache.py --clear
+
+import os
+import json
+import pickle
+import inspect
+import hashlib
+import argparse
+import functools
+import feeds
+import metrics
+import analyzers
+import indicators
+import strategy
+from config import CONFIG
+from strategy import StrategyFactory
+from datastore import data_hash, file_hash
+
+RESULT_DIR = 'results'
+SHARED_MODULES = (indicators, feeds, metrics, analyzers)
+SHARED_OBJECTS = ('VolumeWeightedMovingAverage', 'OnlineStandardDeviation', 'PrecomputedLine', 'precomputed_line',
+                  'vwma_indicator', 'atr_indicator', 'std_indicator', 'TradeRecorder')
+
+
+def result_dir():
+    return os.path.join(CONFIG['cache_dir'] or 'cache/', RESULT_DIR)
+
+
+# 策略类及其在本项目中定义的父类的源码
+def strategy_source(strategy_class):
+    sources = []
+    for cls in strategy_class.__mro__:
+        if cls.__module__.split('.')[0] == 'backtrader' or cls is object:
+            continue
+        try:
+            sources.append(inspect.getsource(cls))
+        except (OSError, TypeError):
+            sources.append(cls.__qualname__)
+    return sources
+
+
+# 各策略共用、参与生成结果的代码的源码；main 导入本模块，在此处延迟导入
+@functools.lru_cache(maxsize=None)
+def shared_source():
+    import main
+    sources = [inspect.getsource(module) for module in SHARED_MODULES]
+    sources += [inspect.getsource(getattr(strategy, name)) for name in SHARED_OBJECTS]
+    sources += [inspect.getsource(function) for function in (main.run_strategy, main.get_metrics, main.print_analysis)]
+    return hashlib.sha256('\n'.join(sources).encode('utf-8')).hexdigest()
+
+
+def result_key(job):
+    strategy_name, timeframe, data_file, strategy_params = job
+    strategy_class = StrategyFactory.get_strategy(strategy_name)
+    fields = {
+        'strategy': strategy_name,
+        'source': strategy_source(strategy_class),
+        'shared_source': shared_source(),
+        'timeframe': timeframe,
+        'params': strategy_params,
+        'friction_cost': CONFIG['friction_cost'],
+        'initial_cash': CONFIG['initial_cash'],
+        'analyzers': CONFIG['analyzers'],
+        'precompute_indicators': CONFIG.get('precompute_indicators'),
+        'data': data_hash(data_file) if CONFIG['cache_dir'] else file_hash(data_file),
+    }
+    encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def entry_path(key):
+    return os.path.join(result_dir(), f'{key}.pkl')
+
+
+# 取缓存结果 (df, analysis_results)，未命中返回 None；命中时刷新修改时间作为最近使用时间。
+# 条目损坏或无法反序列化（如其中引用的类已改名、移动）时同样按未命中处理
+def load_result(key):
+    path = entry_path(key)
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+        os.utime(path)
+        return entry['df'], entry['analysis_results']
+    except Exception:
+        return None
+
+
+def store_result(key, df, analysis_results, max_size_mb=None):
+    directory = result_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = entry_path(key)
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump({'df': df, 'analysis_results': analysis_results}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, path)
+    evict(CONFIG['result_cache']['max_size_mb'] if max_size_mb is None else max_size_mb, keep=path)
+
+
+# 按最近使用时间从旧到新删除条目，直到总大小不超过上限；刚写入的条目保留
+def evict(max_size_mb, keep=None):
+    directory = result_dir()
+    if not max_size_mb or not os.path.isdir(directory):
+        return []
+
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.pkl'):
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+    entries.sort()
+
+    total = sum(size for _, size, _ in entries)
+    limit = max_size_mb * 2 ** 20
+    removed = []
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def clear():
+    directory = result_dir()
+    if not os.path.isdir(directory):
+        return 0
+    names = [name for name in os.listdir(directory) if name.endswith('.pkl')]
+    for name in names:
+        os.remove(os.path.join(directory, name))
+    return len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回测结果缓存')
+    parser.add_argument('--clear', action='store_true', help='清空结果缓存')
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"已删除 {clear()} 个缓存结果")
+        return
+
+    directory = result_dir()
+    names = [name for name in os.listdir(directory) if name.endswith('.pkl')] if os.path.isdir(directory) else []
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+    print(f"{directory}: {len(names)} 个缓存结果，共 {size / 2 ** 20:.1f} MB，"
+          f"上限 {CONFIG['result_cache']['max_size_mb']} MB")
+
+
+if __name__ == '__main__':
+    main()
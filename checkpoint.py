@@ -0,0 +1,210 @@
+# checkpoint.py
+# 增量回测：回测结束时把状态存为检查点，数据文件追加新K线后从检查点继续，只回测新增部分，结果与从头重跑完全一致。
+# 检查点内容：
+#   策略    标量属性（持仓计数、上次入场价等）
+#   券商    现金、持仓数量与均价
+#   订单    最后一根K线上提交、尚未成交的订单
+#   记录    此前的逐K线记录（TradeRecorder 输出），指标由 metrics.py 在完整记录上计算，代替分析器的累加量
+# 指标不保存滑动窗口状态，而是使用整列预计算并缓存的指标（datastore.load_indicators）：指标只依赖此前的数据，
+# 追加数据后已有K线上的取值不变。续跑时数据源从检查点最后一根K线往前 minperiod-1 根开始，
+# 策略在检查点最后一根K线上达到最小周期，此时只恢复状态、重新提交未成交订单，不再执行交易逻辑，
+# 之后的K线与完整回测逐根相同。已回测部分的数据被修改时检查点失效，从头回测。
+# 数据文件追加K线后，列式缓存只解析追加的行、从保存的状态续算指标列（datastore.append_cache），
+# 已回测部分是否被修改由缓存记录的追加前版本哈希确认，续跑的开销只与新增K线数有关
+
+import os
+import io
+import pickle
+import hashlib
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+import backtrader as bt
+from config import CONFIG
+from strategy import StrategyFactory
+from datastore import load_indicators, data_lineage
+from feeds import indicator_feed_class
+from indicators import indicator_column
+from metrics import analyze
+from main import build_jobs, save_results
+
+CHECKPOINT_DIR = 'checkpoints'
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+STATE_TYPES = (bool, int, float, str, type(None), np.bool_, np.integer, np.floating)
+
+
+def checkpoint_path(strategy_name, timeframe, data_file):
+    name = os.path.splitext(os.path.basename(data_file))[0]
+    return os.path.join(CONFIG['cache_dir'] or 'cache/', CHECKPOINT_DIR, f'{strategy_name}_{timeframe}_{name}.pkl')
+
+
+# 前 rows 根K线的时间与 OHLCV 的哈希，用于确认已回测的数据没有被修改
+def prefix_hash(data, rows):
+    digest = hashlib.sha256()
+    digest.update(data.index[:rows].to_numpy().astype('datetime64[ns]').tobytes())
+    for column in PRICE_COLUMNS:
+        digest.update(np.ascontiguousarray(data[column].to_numpy()[:rows], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+# 前 rows 根K线的指纹：有列式缓存时取缓存记录的该行数版本的内容哈希（不重新读取数据），
+# 否则计算时间与 OHLCV 的前缀哈希
+def data_fingerprint(data_file, data, rows):
+    if CONFIG['cache_dir']:
+        return data_lineage(data_file).get(rows)
+    return prefix_hash(data, rows)
+
+
+# 策略的标量属性；backtrader 的内部属性以下划线开头，数据线与指标不是标量，均不会被收集
+def strategy_state(strategy):
+    return {name: value for name, value in vars(strategy).items()
+            if not name.startswith('_') and isinstance(value, STATE_TYPES)}
+
+
+# 在原策略类上加入检查点恢复：start() 恢复券商现金与持仓，
+# 达到最小周期的那根K线（即检查点最后一根K线）恢复策略属性并重新提交未成交订单
+def resumable(strategy_class):
+    class Resumable(strategy_class):
+        params = (('checkpoint', None),)
+
+        def start(self):
+            super().start()
+            checkpoint = self.p.checkpoint
+            if checkpoint is not None:
+                self.broker.cash = checkpoint['cash']
+                self.broker.getposition(self.data).set(checkpoint['position_size'], checkpoint['position_price'])
+
+        def nextstart(self):
+            checkpoint = self.p.checkpoint
+            if checkpoint is None:
+                return super().nextstart()
+
+            if self.data.datetime.datetime(0) != checkpoint['last_time'].to_pydatetime():
+                raise ValueError(f"Checkpoint expects its last bar at {checkpoint['last_time']}, "
+                                 f"got {self.data.datetime.datetime(0)}")
+            for name, value in checkpoint['state'].items():
+                setattr(self, name, value)
+            order = checkpoint['order']
+            if order is not None:
+                submit = self.buy if order['side'] == 'buy' else self.sell
+                self.order = submit(size=order['size'], price=order['price'], exectype=order['exectype'])
+
+    Resumable.__name__ = strategy_class.__name__
+    Resumable.__qualname__ = strategy_class.__qualname__
+    return Resumable
+
+
+def pending_order(strategy):
+    order = getattr(strategy, 'order', None)
+    if order is None or not order.alive():
+        return None
+    return {
+        'side': 'buy' if order.isbuy() else 'sell',
+        'size': abs(order.created.size),
+        'price': order.created.price,
+        'exectype': order.exectype,
+    }
+
+
+def load_checkpoint(file_path):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_checkpoint(file_path, checkpoint):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_file = f'{file_path}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, file_path)
+
+
+# 检查点能否用于当前数据与配置：参数、费用、初始资金一致，已回测部分数据未变
+def usable(checkpoint, data_file, data, strategy_params):
+    if checkpoint is None:
+        return False
+    if (checkpoint['params'] != strategy_params or checkpoint['friction_cost'] != CONFIG['friction_cost']
+            or checkpoint['initial_cash'] != CONFIG['initial_cash']):
+        return False
+    rows = checkpoint['rows']
+    if rows > len(data) or rows < checkpoint['minperiod']:
+        return False
+    fingerprint = checkpoint.get('fingerprint')
+    return fingerprint is not None and data_fingerprint(data_file, data, rows) == fingerprint
+
+
+# 回测并保存检查点；有可用检查点时只回测检查点之后的K线。返回 (完整的逐K线记录, 指标, 本次回测的K线数)
+def run_incremental(data_file, strategy_name, strategy_params, timeframe, checkpoint_file=None, full=False):
+    checkpoint_file = checkpoint_file or checkpoint_path(strategy_name, timeframe, data_file)
+    strategy_class = StrategyFactory.get_strategy(strategy_name)
+    specs = strategy_class.indicator_specs({**strategy_class.params._getpairs(), **strategy_params})
+    data = load_indicators(data_file, specs)
+
+    checkpoint = None if full else load_checkpoint(checkpoint_file)
+    if not usable(checkpoint, data_file, data, strategy_params):
+        checkpoint = None
+    elif checkpoint['rows'] == len(data):
+        return checkpoint['records'], analyze(checkpoint['records'], data.index, CONFIG['initial_cash'])[0], 0
+
+    start = checkpoint['rows'] - checkpoint['minperiod'] if checkpoint else 0
+    feed_class = indicator_feed_class(tuple(indicator_column(spec) for spec in specs))
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(CONFIG['initial_cash'])
+    cerebro.adddata(feed_class(dataname=data.iloc[start:]))
+    cerebro.addstrategy(resumable(strategy_class), timeframe=timeframe, checkpoint=checkpoint, **strategy_params)
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+
+    records = strategy.trade_recorder.get_analysis()
+    if checkpoint is not None:
+        records = pd.concat([checkpoint['records'], records], ignore_index=True)
+
+    position = cerebro.broker.getposition(strategy.data)
+    save_checkpoint(checkpoint_file, {
+        'strategy': strategy_name,
+        'timeframe': timeframe,
+        'params': strategy_params,
+        'friction_cost': CONFIG['friction_cost'],
+        'initial_cash': CONFIG['initial_cash'],
+        'rows': len(data),
+        'last_time': data.index[-1],
+        'fingerprint': data_fingerprint(data_file, data, len(data)),
+        'minperiod': strategy._minperiod,
+        'state': strategy_state(strategy),
+        'cash': cerebro.broker.getcash(),
+        'position_size': position.size,
+        'position_price': position.price,
+        'order': pending_order(strategy),
+        'records': records,
+    })
+
+    metrics, _, _ = analyze(records, data.index, CONFIG['initial_cash'])
+    return records, metrics, len(data) - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量回测：从检查点继续回测新增的K线')
+    parser.add_argument('--strategies', nargs='*', default=None)
+    parser.add_argument('--timeframes', nargs='*', default=None)
+    parser.add_argument('--full', action='store_true', help='忽略已有检查点，从头回测')
+    args = parser.parse_args()
+
+    for job in build_jobs():
+        strategy_name, timeframe, data_file, strategy_params = job
+        if args.strategies and strategy_name not in args.strategies:
+            continue
+        if args.timeframes and timeframe not in args.timeframes:
+            continue
+
+        records, metrics, bars = run_incremental(data_file, strategy_name, strategy_params, timeframe, full=args.full)
+        print(f"{strategy_name} {timeframe}: 本次回测 {bars} 根K线，"
+              f"总收益率 {metrics['总收益率']:.2%}，最大回撤 {metrics['最大回撤']:.2%}")
+        save_results(job, records.copy())
+
+
+if __name__ == '__main__':
+    main()
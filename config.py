@@ -3,6 +3,9 @@
 CONFIG = {
     'initial_cash': 100000,
     'friction_cost': 1/1000,
+    'workers': 1, # 并行回测进程数：1 为串行，0 或 None 为使用全部CPU核心
+    'shared_data': 'mmap', # 并行时子进程共享数据的方式：'shm' 共享内存 / 'mmap' 内存映射缓存 / None 各自加载
+    'precompute_indicators': True, # 回测前按 (数据文件, 指标参数) 预计算 VWMA / ATR / std 并缓存，策略直接读取预计算的数据线
 
     # ↓ 调整策略适用的、不同时间周期的参数
     'strategies': {  
@@ -52,10 +55,12 @@ CONFIG = {
             'enabled_timeframes': ['5min', '240min'],
             'params': {
                 '5min': {
-                    'k':3/100
+                    'k':3/100,
+                    'std_mode': 'expanding'   # 标准差模式: expanding / rolling / ewm（后两者需设置 std_period）
                 },
                 '240min': {
-                    'k':1/100
+                    'k':1/100,
+                    'std_mode': 'expanding'
                 }
             }
         },
@@ -66,24 +71,168 @@ CONFIG = {
                     'p':1.6,
                     'k':3/100,
                     'vwma_period': 14,
-                    'atr_period': 14
+                    'atr_period': 14,
+                    'std_mode': 'expanding'
                 },
                 '240min': {
                     'p':0.7,
                     'k':1/100,
                     'vwma_period': 14,
-                    'atr_period': 14
+                    'atr_period': 14,
+                    'std_mode': 'expanding'
                 }
             }
         },
     },
+    # ↓ 参数寻优（optimize.py）
+    'optimization': {
+        'strategy': 'SupertrendATR',
+        'timeframe': '240min',
+        'method': 'grid',       # grid 网格 / random 随机 / lhs 拉丁超立方
+        'samples': 50,          # random、lhs 的采样数量
+        'seed': 42,
+        'sort_by': '年化收益率',  # 排序指标，取 print_analysis 中的指标名
+        'engine': 'backtrader',  # backtrader 逐个回测 / vectorized 纯 NumPy 回测（SupertrendATR/Sd/Mf），k 等阈值参数一次遍历批量计算
+        'params': {             # 列表为离散取值；(low, high) 为区间；网格搜索时区间写作 (low, high, num)
+            'k': (0.5, 2.0, 7),
+            'vwma_period': [10, 14, 20],
+            'atr_period': [14],
+        }
+    },
+    # ↓ 滚动窗口回测（walkforward.py），窗口长度以K线根数计
+    'walk_forward': {
+        'strategy': 'SupertrendATR',
+        'timeframe': '240min',
+        'in_sample': 2000,      # 样本内寻优窗口
+        'out_of_sample': 500,   # 样本外检验窗口
+        'step': None,           # 窗口滚动步长，None 为等于样本外长度
+        'method': 'grid',
+        'samples': 20,
+        'seed': 42,
+        'sort_by': '年化收益率',
+        'params': {
+            'k': (0.5, 2.0, 7),
+            'vwma_period': [10, 14, 20],
+            'atr_period': [14],
+        }
+    },
+    # 组合回测（portfolio.py）
+    'portfolio': {
+        'strategy': 'SupertrendATR',
+        'timeframe': '240min',
+        'files': 'processed/*_{timeframe}.csv',  # 数据文件模式，标的名取自文件名 <交易所>_<标的>_<时间框架>.csv
+        'allocation': 'equal',  # 资金分配：'equal' 等权，或 {'QQQ': 0.6, 'BTC': 0.4} 按权重
+        'batch_size': 10,       # 每个子进程任务包含的标的数
+        'save_details': False,  # 是否为每个标的保存交易记录与可视化数据
+    },
+
+    # 合成数据（synthetic.py）
+    'synthetic': {
+        'model': 'regime',             # 'gbm' 几何布朗运动 / 'regime' 状态切换
+        'start': '2015-01-02',         # 第一根K线所在日期
+        'session': ('09:30', '16:00'), # 每个工作日的交易时段
+        'price': 100.0,                # 初始价格
+        'drift': 0.08,                 # gbm 的年化漂移
+        'volatility': 0.2,             # gbm 的年化波动率
+        'regimes': [                   # regime 的各状态：年化漂移、年化波动率、成交量倍数
+            {'drift': 0.15, 'volatility': 0.15, 'volume': 1.0},
+            {'drift': -0.25, 'volatility': 0.35, 'volume': 1.8},
+            {'drift': 0.0, 'volatility': 0.1, 'volume': 0.7},
+        ],
+        'mean_regime_bars': 5000,      # 状态的平均持续K线数
+        'volume': 100000,              # 基础成交量
+        'atr_period': 14,              # atr 列的周期
+        'chunk_size': 1_000_000,       # 每块生成并写出的K线数
+    },
+
+    # 基准测试（benchmark.py）
+    'benchmark': {
+        'sizes': [10_000, 100_000],  # 默认的合成数据K线数，几分钟内跑完，用作日常回归检查
+        'large_sizes': [1_000_000, 10_000_000],  # python benchmark.py --large 时追加的大规模数据
+        'large_repeat': 1,    # 大规模数据的计时次数
+        'repeat': 3,          # 计时重复次数，取最小值
+        'memory': True,       # 是否另跑一遍测量各阶段内存峰值
+        'tolerance': 0.2,     # 与基准对比时允许的相对退化
+        'baseline': None,     # 基准结果 JSON 路径，设置后对比并在退化时以非零状态退出
+    },
+
     'data_files': {
         'qqq_5min': 'processed/BATS_QQQ_5min.csv',   # 数据文件 QQQ 5min
         'qqq_240min': 'processed/BATS_QQQ_240min.csv' # 数据文件 QQQ 240min
     },
+    # 更粗的时间框架由基础数据按需聚合（resample.py）；data_files 中已有对应文件时直接使用
+    'resample': {
+        'base_timeframe': '5min',  # 聚合所用的基础时间框架
+        'anchor': 'session',       # 桶的对齐方式：'session' 从每天第一根K线起 / 'midnight' 从 0 点起
+        'atr_period': 14,          # 聚合后 atr 列的周期
+    },
+
+    # 分析器（analyzers.py）：默认只保留累加量，内存与回测长度无关；
+    # capture 为 True 时额外保存逐K线累计收益与每笔已平仓交易，供报告或绘图使用。
+    # enabled 为 False 时回测不挂分析器，结束后由 metrics.py 从逐K线记录一次性计算全部指标（结果相同）；
+    # 开启分块写出（stream_output）时仍使用分析器。rolling_years 为滚动指标的窗口年数
+    'analyzers': {
+        'enabled': True,
+        'capture': False,
+        'rolling_years': 1.0,
+    },
+
+    # 回测结果缓存（cache.py）：按 策略类与共用代码（指标、TradeRecorder、指标计算、分析器）的源码、参数、
+    # friction_cost、initial_cash、analyzers 与 precompute_indicators 设置、数据内容哈希 命中，
+    # 输入不变的任务不再重跑；缓存总大小超过 max_size_mb 时淘汰最久未用的结果
+    'result_cache': {
+        'enabled': True,
+        'max_size_mb': 512,
+    },
+
+    # 流式运行（live.py）：K线逐根经队列（queue）或本地回放服务器（socket）送入策略，测量逐K线决策延迟；
+    # interval 为推送间隔（秒，0 为不等待，此时K线在队列中积压，只有处理耗时有意义），bars 为回放最后若干根K线（0 为全部），
+    # budget_ms 为 p99 决策延迟上限，timeout 为等待下一根K线的最长秒数（None 为一直等待）
+    'live': {
+        'strategy': 'SupertrendMf',
+        'timeframe': '5min',
+        'source': 'queue',
+        'interval': 0.005,
+        'bars': 2000,
+        'budget_ms': 5.0,
+        'host': '127.0.0.1',
+        'port': 0,
+        'timeout': None,
+    },
+
+    # 耗时剖析（profiling.py）：开启后每次回测按 "类名.回调" 统计调用次数与耗时，
+    # 分组件表与折叠调用栈写到 output_dir/profile/；关闭时不替换任何方法，没有额外开销
+    'profiling': {
+        'enabled': False,
+        'top': 20,
+    },
+
+    # 稳健性分析（robustness.py）：对逐K线收益与每笔交易收益重抽样，给出年化收益率、最大回撤、夏普比率的置信区间；
+    # block_size 为移动块自助法的块长（K线数），None 时取 K线数的立方根；batch_size 为每批（每个进程任务）的重抽样次数
+    'robustness': {
+        'strategy': 'SupertrendATR',
+        'timeframe': '5min',
+        'methods': ['bootstrap', 'block', 'shuffle'],
+        'resamples': 10000,
+        'block_size': None,
+        'confidence': 0.95,
+        'batch_size': 100,
+        'seed': 42,
+    },
+
     'output_dir': 'results/', # 输出文件夹位置
+    'cache_dir': 'cache/', # 处理后数据的二进制缓存位置，设为 None 则每次直接读取 CSV
     'df_dir':'visual/',
+    'stream_output': {          # 回测过程中分块写出交易记录与可视化数据，内存中只保留一块
+        'enabled': False,
+        'chunk_size': 50000,    # 每块行数
+        'format': 'csv'         # csv / columnar（二进制列式目录，见 writers.py）
+    },
     'visualization': {
-        'data_path': 'results/vad_5min_trades.csv'  # 需要可视化的文件
+        'data_path': 'results/vad_5min_trades.csv',  # 需要可视化的文件
+        'cache_size': 16,     # 进程内缓存的已解析数据文件数
+        'range_margin': 0.5,  # 按可见范围取数时两侧各多取的比例（相对可见窗口长度）
+        'max_points': 2000,   # 每条K线 / 曲线最多绘制的点数，None 表示不降采样
+        'line_downsample': 'lttb',  # 资金曲线与资金利用率的降采样方式：'lttb' / 'minmax'
     }
 }
\ No newline at end of file
@@ -0,0 +1,279 @@
+# datastore.py
+# 处理后数据的二进制列式缓存：首次读取时把 CSV 转换为按列存放的 .npy 文件，
+# 之后以内存映射方式加载，多个进程读取同一份缓存时可共享页面。
+# 指标列（VWMA / ATR / std）按 (数据文件, 指标参数) 计算一次后存放在同一缓存目录的 indicators/ 下。
+# 源文件只在末尾追加K线时，只解析追加的部分并接到各列 .npy 文件末尾，指标列从保存的状态续算
+
+import os
+import io
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from indicators import calc_indicator, extend_indicator, indicator_column
+
+META_FILE = 'meta.json'
+INDEX_FILE = 'datetime.npy'
+INDICATOR_DIR = 'indicators'
+# 元数据中保留的追加前版本 (行数, 哈希) 个数，供检查点确认已回测的数据未变
+LINEAGE_LIMIT = 1000
+
+
+# 缓存目录：cache_dir/<数据文件名>-<绝对路径哈希>/，不同目录下的同名文件（如 processed/ 与 cache/resampled/）互不覆盖
+def cache_path(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    digest = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(CONFIG['cache_dir'], f'{name}-{digest}')
+
+
+# 源文件内容哈希
+def file_hash(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_meta(directory):
+    meta_file = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_meta(directory, meta):
+    # 先写临时文件再替换，避免并行进程读到写了一半的元数据
+    meta_file = os.path.join(directory, META_FILE)
+    tmp_file = f"{meta_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, meta_file)
+
+
+def save_array(directory, filename, array):
+    target = os.path.join(directory, filename)
+    tmp_file = f"{target}.{os.getpid()}.tmp.npy"
+    np.save(tmp_file, array)
+    os.replace(tmp_file, target)
+
+
+# 把一维数组接到 .npy 文件末尾：原地改写头部中的长度（np.save 写头部时预留了长度增长的空间），
+# 头部放不下时整个文件重写
+def append_array(directory, filename, values):
+    target = os.path.join(directory, filename)
+    with open(target, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        header_end = f.tell()
+        values = np.ascontiguousarray(values, dtype=dtype)
+        header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                       'shape': (shape[0] + len(values),)})
+        header_start = 8 + (2 if version == (1, 0) else 4)
+        space = header_end - header_start - 1
+        if len(header) <= space:
+            f.seek(0, os.SEEK_END)
+            f.write(values.tobytes())
+            f.seek(header_start)
+            f.write((header.ljust(space) + '\n').encode('latin1'))
+            return
+    save_array(directory, filename, np.concatenate((np.load(target), values)))
+
+
+# 检查缓存是否仍对应当前源文件：mtime 与大小一致直接命中；
+# 不一致时再比较内容哈希，内容未变只刷新元数据
+def is_valid(file_path, meta):
+    if meta is None:
+        return False
+
+    stat = os.stat(file_path)
+    if meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+        return True
+
+    if meta['size'] == stat.st_size and meta['hash'] == file_hash(file_path):
+        meta['mtime_ns'] = stat.st_mtime_ns
+        write_meta(cache_path(file_path), meta)
+        return True
+
+    return False
+
+
+# 解析 CSV 并写入缓存
+def build_cache(file_path):
+    stat = os.stat(file_path)
+    data = pd.read_csv(file_path, index_col='datetime', parse_dates=True)
+
+    directory = cache_path(file_path)
+    os.makedirs(directory, exist_ok=True)
+    # 源数据变了，之前算好的指标列随之失效
+    shutil.rmtree(os.path.join(directory, INDICATOR_DIR), ignore_errors=True)
+
+    save_array(directory, INDEX_FILE, data.index.to_numpy())
+    for column in data.columns:
+        save_array(directory, f'{column}.npy', data[column].to_numpy())
+
+    meta = {
+        'source': file_path,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'hash': file_hash(file_path),
+        'rows': len(data),
+        'columns': list(data.columns),
+        'lineage': [],
+    }
+    write_meta(directory, meta)
+    return meta
+
+
+# 源文件是否只在末尾追加了内容：顺序读取一遍文件，原大小以内的字节哈希须与缓存的内容哈希相同，
+# 且原文件以换行结尾。同一遍读取接着算出整个文件的内容哈希（只读不解析，远快于重新解析 CSV）。
+# 是追加时返回 (追加的字节, 当前文件的内容哈希)，否则返回 None
+def read_append(file_path, meta, chunk_size=1 << 20):
+    if meta is None or os.stat(file_path).st_size <= meta['size']:
+        return None
+
+    digest = hashlib.sha1()
+    remaining = meta['size']
+    last = b''
+    with open(file_path, 'rb') as f:
+        while remaining:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                return None
+            digest.update(chunk)
+            remaining -= len(chunk)
+            last = chunk[-1:]
+        if last != b'\n' or digest.hexdigest() != meta['hash']:
+            return None
+        appended = f.read()
+    digest.update(appended)
+    return appended, digest.hexdigest()
+
+
+# 只解析追加的行，接到各列末尾并续算已缓存的指标列；追加前的 (行数, 内容哈希) 记入 lineage
+def append_cache(file_path, meta, appended, content_hash):
+    stat = os.stat(file_path)
+    new = pd.read_csv(io.BytesIO(appended), header=None, names=['datetime'] + meta['columns'],
+                      index_col='datetime', parse_dates=True)
+
+    directory = cache_path(file_path)
+    data = load_processed_columns(directory, meta)
+    dtypes = [data.index.dtype] + [data[column].dtype for column in meta['columns']]
+    new_dtypes = [new.index.dtype] + [new[column].dtype for column in meta['columns']]
+    if not all(np.can_cast(new_dtype, dtype, 'same_kind') for new_dtype, dtype in zip(new_dtypes, dtypes)):
+        return build_cache(file_path)
+
+    # 追加过程中没有元数据，中途中断时下次重新构建缓存
+    os.remove(os.path.join(directory, META_FILE))
+    append_array(directory, INDEX_FILE, new.index.to_numpy())
+    for column in meta['columns']:
+        append_array(directory, f'{column}.npy', new[column].to_numpy())
+    extend_indicators(directory, load_processed_columns(directory, meta))
+
+    lineage = meta.get('lineage', []) + [{'rows': meta['rows'], 'hash': meta['hash']}]
+    meta.update({
+        'mtime_ns': stat.st_mtime_ns,
+        'size': meta['size'] + len(appended),
+        'hash': content_hash,
+        'rows': meta['rows'] + len(new),
+        'lineage': lineage[-LINEAGE_LIMIT:],
+    })
+    write_meta(directory, meta)
+    return meta
+
+
+# 续算 indicators/ 下的各指标列；没有记录指标描述的列（旧版本缓存）删除，之后用到时重新计算
+def extend_indicators(directory, data):
+    directory = os.path.join(directory, INDICATOR_DIR)
+    meta = read_meta(directory)
+    if meta is None:
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+
+    for column, entry in list(meta['columns'].items()):
+        filename = f'{column}.npy'
+        if not os.path.exists(os.path.join(directory, filename)):
+            del meta['columns'][column]
+            continue
+        values, entry['state'] = extend_indicator(data, tuple(entry['spec']), load_column(directory, filename),
+                                                  entry['state'])
+        append_array(directory, filename, values)
+    write_meta(directory, meta)
+    for filename in os.listdir(directory):
+        if filename.endswith('.npy') and filename[:-4] not in meta['columns']:
+            os.remove(os.path.join(directory, filename))
+
+
+# 确保缓存有效，返回其元数据
+def ensure_cache(file_path):
+    meta = read_meta(cache_path(file_path))
+    if is_valid(file_path, meta):
+        return meta
+    appended = read_append(file_path, meta)
+    if appended is not None:
+        return append_cache(file_path, meta, *appended)
+    return build_cache(file_path)
+
+
+# 源数据的内容哈希（取自缓存元数据，无需重新读取文件）
+def data_hash(file_path):
+    return ensure_cache(file_path)['hash']
+
+
+# 当前及追加前各版本的 {行数: 内容哈希}，用于确认前若干行与某次记录时相同
+def data_lineage(file_path):
+    meta = ensure_cache(file_path)
+    entries = meta.get('lineage', []) + [{'rows': meta['rows'], 'hash': meta['hash']}]
+    return {entry['rows']: entry['hash'] for entry in entries}
+
+
+# 加载处理后的数据：列以只读内存映射方式打开，DataFrame 直接引用这些数组
+def load_column(directory, filename):
+    # np.asarray 去掉 memmap 子类，得到引用同一映射内存的普通数组
+    return np.asarray(np.load(os.path.join(directory, filename), mmap_mode='r'))
+
+
+def load_processed_columns(directory, meta):
+    index = pd.DatetimeIndex(load_column(directory, INDEX_FILE), name='datetime')
+    columns = {column: load_column(directory, f'{column}.npy') for column in meta['columns']}
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def load_processed(file_path):
+    if not CONFIG.get('cache_dir'):
+        return pd.read_csv(file_path, index_col='datetime', parse_dates=True)
+
+    meta = ensure_cache(file_path)
+    return load_processed_columns(cache_path(file_path), meta)
+
+
+# 加载处理后的数据并附加指标列：已缓存的指标直接内存映射，缺少的现算并写入缓存，
+# 指标描述与续算状态记入 indicators/meta.json；未设置 cache_dir 时每次现算
+def load_indicators(file_path, specs):
+    data = load_processed(file_path)
+    columns = {column: data[column].to_numpy() for column in data.columns}
+
+    directory = os.path.join(cache_path(file_path), INDICATOR_DIR) if CONFIG.get('cache_dir') else None
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        meta = read_meta(directory) or {'columns': {}}
+    for spec in specs:
+        column = indicator_column(spec)
+        if directory is None:
+            columns[column] = calc_indicator(data, spec)
+            continue
+        filename = f'{column}.npy'
+        if column not in meta['columns'] or not os.path.exists(os.path.join(directory, filename)):
+            values, state = extend_indicator(data, spec)
+            save_array(directory, filename, values)
+            # 重新读取后再写入，减少并行进程计算不同指标时互相覆盖记录
+            meta = read_meta(directory) or {'columns': {}}
+            meta['columns'][column] = {'spec': list(spec), 'state': state}
+            write_meta(directory, meta)
+        columns[column] = load_column(directory, filename)
+
+    return pd.DataFrame(columns, index=data.index, copy=False)
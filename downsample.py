@@ -0,0 +1,86 @@
+# downsample.py
+# 可视化降采样：K线按可见范围等分为若干桶合并为一根（开=首根开盘，高=最高，低=最低，收=末根收盘），
+# 资金曲线、资金利用率用 LTTB 或 最小/最大值 分桶保留形状。点数上限固定，图表数据量不随回测长度增长。
+# 交易标记不经过这里，始终保留全部
+
+import numpy as np
+import pandas as pd
+
+
+# 把 n 行等分为 buckets 段，返回各段起点（升序、不重复）
+def bucket_starts(n, buckets):
+    return np.unique(np.linspace(0, n, buckets + 1).astype(np.int64)[:-1])
+
+
+# 合并K线，时间取每桶第一根
+def downsample_ohlc(df, buckets, time_column='时间'):
+    if not buckets or len(df) <= buckets:
+        return df
+
+    starts = bucket_starts(len(df), buckets)
+    ends = np.append(starts[1:], len(df)) - 1
+    return pd.DataFrame({
+        time_column: df[time_column].to_numpy()[starts],
+        'open': df['open'].to_numpy()[starts],
+        'high': np.maximum.reduceat(df['high'].to_numpy(dtype=np.float64), starts),
+        'low': np.minimum.reduceat(df['low'].to_numpy(dtype=np.float64), starts),
+        'close': df['close'].to_numpy()[ends],
+    })
+
+
+# Largest-Triangle-Three-Buckets：首尾点保留，中间每桶选出与前一个选中点、后一桶均值点
+# 组成三角形面积最大的点，返回选中行号
+def lttb_indices(x, y, threshold):
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected[i + 1] = a
+    return selected
+
+
+# 最小/最大值分桶：每桶保留最小值与最大值所在行，尖峰不会被抹平
+def minmax_indices(y, buckets):
+    n = len(y)
+    if buckets * 2 >= n:
+        return np.arange(n)
+
+    starts = bucket_starts(n, buckets)
+    ends = np.append(starts[1:], n)
+    indices = []
+    for lo, hi in zip(starts, ends):
+        segment = y[lo:hi]
+        indices += [lo + int(np.nanargmin(segment)), lo + int(np.nanargmax(segment))] \
+            if not np.isnan(segment).all() else [lo]
+    indices += [0, n - 1]
+    return np.unique(indices)
+
+
+# 对单列曲线降采样，返回选中的行；method 为 'lttb' / 'minmax'，None 表示不降采样
+def downsample_line(df, column, points, method='lttb', time_column='时间'):
+    if not points or not method or len(df) <= points:
+        return df
+
+    y = df[column].to_numpy(dtype=np.float64)
+    if method == 'lttb':
+        x = df[time_column].to_numpy().astype('datetime64[ns]').view(np.int64).astype(np.float64)
+        indices = lttb_indices(x, y, points)
+    elif method == 'minmax':
+        indices = minmax_indices(y, points // 2)
+    else:
+        raise ValueError(f"Unsupported downsample method: {method}")
+    return df.iloc[indices]
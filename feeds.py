@@ -0,0 +1,83 @@
+# feeds.py
+# 可在多个回测进程间共享的数据源：
+#   shm:  数据写入一块 multiprocessing.shared_memory，子进程按描述信息挂载
+#   mmap: 子进程以内存映射方式打开 datastore 的列缓存
+# 两种方式下各进程的 DataFrame 都直接引用同一份物理内存，不再各自持有副本
+
+import functools
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import backtrader as bt
+from datastore import ensure_cache, load_processed, load_indicators
+
+ALIGNMENT = 8
+
+
+# 把 DataFrame（含时间索引）按列写入共享内存，返回共享内存对象与可序列化的描述信息；
+# 调用方负责在所有进程用完后 close() 并 unlink()
+def share_data(data):
+    arrays = [('datetime', data.index.to_numpy())]
+    arrays += [(column, data[column].to_numpy()) for column in data.columns]
+
+    layout = []
+    offset = 0
+    for name, array in arrays:
+        layout.append((name, array.dtype.str, offset))
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (name, dtype, offset), (_, array) in zip(layout, arrays):
+        np.ndarray(len(data), dtype=dtype, buffer=shm.buf, offset=offset)[:] = array
+
+    descriptor = {'shm': shm.name, 'rows': len(data), 'layout': layout}
+    return shm, descriptor
+
+
+# 数据文件的共享描述：确保列缓存（及所需指标列）已生成，子进程直接内存映射
+def share_file(file_path, specs=()):
+    ensure_cache(file_path)
+    if specs:
+        load_indicators(file_path, specs)
+    return {'file': file_path, 'indicators': list(specs)}
+
+
+# 按描述信息挂载共享数据，返回 (句柄, DataFrame)；DataFrame 存活期间必须持有句柄
+def attach_data(descriptor):
+    if 'file' in descriptor:
+        if descriptor.get('indicators'):
+            return None, load_indicators(descriptor['file'], descriptor['indicators'])
+        return None, load_processed(descriptor['file'])
+
+    shm = shared_memory.SharedMemory(name=descriptor['shm'])
+    rows = descriptor['rows']
+    columns = {
+        name: np.ndarray(rows, dtype=dtype, buffer=shm.buf, offset=offset)
+        for name, dtype, offset in descriptor['layout']
+    }
+    index = pd.DatetimeIndex(columns.pop('datetime'), name='datetime')
+    return shm, pd.DataFrame(columns, index=index, copy=False)
+
+
+# PandasData 的扩展：多一条 atr 数据线，可通过 shared 参数从共享内存/内存映射加载
+class SharedPandasData(bt.feeds.PandasData):
+    lines = ('atr',)
+    params = (
+        ('atr', -1),
+        ('shared', None),
+    )
+
+    def __init__(self):
+        self.shm = None
+        if self.p.shared is not None:
+            self.shm, self.p.dataname = attach_data(self.p.shared)
+        super().__init__()
+
+
+# 为预计算的指标列（如 vwma_14、atr_14）生成带对应数据线的 SharedPandasData 子类
+@functools.lru_cache(maxsize=None)
+def indicator_feed_class(columns):
+    return type('IndicatorPandasData', (SharedPandasData,), {
+        'lines': tuple(columns),
+        'params': tuple((column, -1) for column in columns),
+    })
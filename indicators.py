@@ -0,0 +1,290 @@
+# indicators.py
+# 基于 NumPy 的整列指标计算，供 backtrader 指标的 once() 批量模式使用，
+# 也用于在回测前把指标预计算为数据源的额外列
+
+import math
+import numpy as np
+import pandas as pd
+
+
+# 滑动窗口求和：按 block 根分段做累计和，每段带上前 period-1 个值，相邻窗口相减的舍入误差
+# 只与段长有关，不随序列长度累积；返回 len(values) - period + 1 个窗口和
+def window_sum(values, period, block=512):
+    count = len(values) - period + 1
+    segments = -(-count // block)
+    padded = np.concatenate((values, np.zeros(segments * block - count)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, block + period - 1)[::block]
+    cum = np.zeros((segments, block + period))
+    np.cumsum(windows, axis=1, out=cum[:, 1:])
+    return (cum[:, period:] - cum[:, :-period]).ravel()[:count]
+
+
+# 计算VWMA：滑动窗口内的 Σ(价格×成交量) / Σ成交量，前 period-1 个值为 nan
+def calc_vwma(close, volume, period):
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+
+    result = np.full(len(close), np.nan)
+    if len(close) < period:
+        return result
+
+    result[period - 1:] = window_sum(close * volume, period) / window_sum(volume, period)
+    return result
+
+
+# 增量标准差（总体标准差），每次更新 O(1)，数值上比累计平方和稳定
+#   expanding: Welford 算法，覆盖自第一根K线以来的全部数据
+#   rolling:   Welford 算法的滑动窗口版本，窗口长度为 period，需要传入移出窗口的值
+#   ewm:       指数加权方差（West 算法），span 为 period，alpha = 2 / (period + 1)
+class RunningStd:
+    modes = ('expanding', 'rolling', 'ewm')
+
+    def __init__(self, mode='expanding', period=None):
+        if mode not in self.modes:
+            raise ValueError(f"Unsupported std mode: {mode}")
+        if mode in ('rolling', 'ewm') and not period:
+            raise ValueError(f"std mode '{mode}' requires a period")
+
+        self.mode = mode
+        self.period = period
+        self.alpha = 2.0 / (period + 1) if mode == 'ewm' else None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value, old_value=None):
+        if self.mode == 'ewm':
+            if self.count == 0:
+                self.mean = value
+            else:
+                diff = value - self.mean
+                incr = self.alpha * diff
+                self.mean += incr
+                self.m2 = (1 - self.alpha) * (self.m2 + diff * incr)
+            self.count += 1
+            return self.m2 ** 0.5
+
+        if self.mode == 'rolling' and self.count == self.period:
+            # 新值替换窗口中最旧的值
+            delta = value - old_value
+            old_mean = self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean + old_value - old_mean)
+            self.m2 = max(self.m2, 0.0)
+        else:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+
+        return (self.m2 / self.count) ** 0.5
+
+    # rolling 模式下用窗口内的全部值重新计算均值与 M2（两遍法），消除滑动更新累积的舍入误差
+    def reset(self, values):
+        self.count = len(values)
+        self.mean = math.fsum(values) / self.count
+        self.m2 = math.fsum((value - self.mean) ** 2 for value in values)
+        return (self.m2 / self.count) ** 0.5
+
+
+# 各前缀的总体方差：按 block 根分段，段内以段首值为中心做累计和（避免大数相减；只依赖此前的数据，
+# 数据末尾追加后已有位置的结果逐位不变），
+# 段与此前全部数据的 (数量, 均值, M2) 用 Chan 合并公式接上。
+# state 为此前数据的 (数量, 均值, M2)；返回 (方差, 最后一个完整段末尾的状态)，从该状态续算与整列计算逐位相同
+def expanding_var(values, block=1024, state=(0, 0.0, 0.0)):
+    n = len(values)
+    result = np.empty(n)
+    count, mean, m2 = state
+    boundary = state
+    for start in range(0, n, block):
+        chunk = values[start:start + block]
+        center = chunk[0]
+        y = chunk - center
+        k = np.arange(1, len(chunk) + 1)
+        s1 = np.cumsum(y)
+        chunk_mean = s1 / k
+        chunk_m2 = np.maximum(np.cumsum(y * y) - s1 * chunk_mean, 0.0)
+
+        delta = center + chunk_mean - mean
+        total = count + k
+        prefix_mean = mean + delta * k / total
+        prefix_m2 = m2 + chunk_m2 + delta * delta * count * k / total
+        result[start:start + len(chunk)] = prefix_m2 / total
+        count, mean, m2 = int(total[-1]), float(prefix_mean[-1]), float(prefix_m2[-1])
+        if len(chunk) == block:
+            boundary = (count, mean, m2)
+    return result, boundary
+
+
+# 滑动窗口的总体方差：与 window_sum 相同按段累计，段内以段首值为中心；返回 len(values) - period + 1 个值
+def window_var(values, period, block=512):
+    count = len(values) - period + 1
+    segments = -(-count // block)
+    padded = np.concatenate((values, np.full(segments * block - count, values[-1])))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, block + period - 1)[::block]
+    y = windows - windows[:, :1]
+    cum1 = np.zeros((segments, block + period))
+    cum2 = np.zeros((segments, block + period))
+    np.cumsum(y, axis=1, out=cum1[:, 1:])
+    np.cumsum(y * y, axis=1, out=cum2[:, 1:])
+    s1 = cum1[:, period:] - cum1[:, :-period]
+    s2 = cum2[:, period:] - cum2[:, :-period]
+    return np.maximum(s2 - s1 * s1 / period, 0.0).ravel()[:count] / period
+
+
+# 整列计算标准差，与逐根K线调用 RunningStd 的结果一致（只差舍入误差）：
+#   expanding / rolling 用分段累计和，rolling 的前 period-1 根与 expanding 相同（窗口未满）；
+#   ewm 用 pandas 的 ewm(adjust=False)，与 West 递推相同
+def calc_std(close, mode='expanding', period=None):
+    if mode not in RunningStd.modes:
+        raise ValueError(f"Unsupported std mode: {mode}")
+    if mode in ('rolling', 'ewm') and not period:
+        raise ValueError(f"std mode '{mode}' requires a period")
+
+    close = np.asarray(close, dtype=np.float64)
+    if mode == 'ewm':
+        return np.sqrt(pd.Series(close).ewm(span=period, adjust=False).var(bias=True).to_numpy())
+
+    if mode == 'rolling' and len(close) >= period:
+        result = np.empty(len(close))
+        result[:period - 1] = expanding_var(close[:period - 1])[0]
+        result[period - 1:] = window_var(close, period)
+        return np.sqrt(result)
+    return np.sqrt(expanding_var(close)[0])
+
+
+# 计算ATR：与 bt.indicators.ATR 相同，真实波幅经 Wilder 平滑（alpha = 1/period），
+# 以前 period 个真实波幅的简单平均为初值；前 period 个值为 nan
+def calc_atr(high, low, close, period):
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    result = np.full(len(close), np.nan)
+    if len(close) <= period:
+        return result
+
+    prev_close = close[:-1]
+    true_range = np.maximum(high[1:], prev_close) - np.minimum(low[1:], prev_close)
+
+    prev = math.fsum(true_range[:period].tolist()) / period
+    result[period] = prev
+    result[period + 1:] = wilder_smooth(true_range[period:], period, prev)
+    return result
+
+
+# Wilder 平滑的递推部分：从上一个 ATR 值 prev 起，依次并入真实波幅
+def wilder_smooth(true_range, period, prev):
+    alpha = 1.0 / period
+    alpha1 = 1.0 - alpha
+    result = np.empty(len(true_range))
+    for i, value in enumerate(true_range.tolist()):
+        result[i] = prev = prev * alpha1 + value * alpha
+    return result
+
+
+# 不留空值的 Wilder ATR：首根K线以 high - low 作为真实波幅起点（与 processed/ 数据中 atr 列的形式一致），
+# 用于生成合成数据与聚合后的K线。prev_close / atr 为上一段末尾的状态，可分段递推；返回 (atr 列, 末尾 atr)
+def calc_seeded_atr(high, low, close, period, prev_close=None, atr=None):
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    previous = np.concatenate(([close[0] if prev_close is None else prev_close], close[:-1]))
+    true_range = np.maximum(high, previous) - np.minimum(low, previous)
+
+    result = np.empty(len(close))
+    for i, value in enumerate(true_range.tolist()):
+        atr = value if atr is None else atr + (value - atr) / period
+        result[i] = atr
+    return result, atr
+
+
+# 指标描述：('vwma', period) / ('atr', period) / ('std', mode, period)
+# 预计算后以 indicator_column(spec) 为列名放入数据源
+def indicator_column(spec):
+    name, *args = spec
+    return '_'.join([name] + [str(arg) for arg in args if arg is not None])
+
+
+def calc_indicator(data, spec):
+    name, *args = spec
+    if name == 'vwma':
+        return calc_vwma(data['close'], data['volume'], *args)
+    if name == 'atr':
+        return calc_atr(data['high'], data['low'], data['close'], *args)
+    if name == 'std':
+        return calc_std(data['close'], *args)
+    raise ValueError(f"Unknown indicator: {name}")
+
+
+# 数据末尾追加K线后续算指标列：column 为已有的前 len(column) 个值（None 表示从头计算），state 为上次返回的状态。
+# 返回 (新增K线上的指标值, 新状态)，只计算新增部分与其前面不超过一个分段（或一个窗口）的数据：
+#   vwma / rolling std  从新增窗口所在分段的起点重算，分段与整列计算对齐，结果逐位相同
+#   atr                 从已有的最后一个 ATR 值继续 Wilder 递推，结果逐位相同
+#   expanding std       从最后一个完整分段末尾的 (数量, 均值, M2) 续算，结果逐位相同
+#   ewm std             从 (数量, 均值, M2) 继续 RunningStd 递推，与整列计算只差舍入误差
+def extend_indicator(data, spec, column=None, state=None):
+    name, *args = spec
+    rows = 0 if column is None else len(column)
+    close = np.asarray(data['close'], dtype=np.float64)
+
+    if name == 'vwma':
+        period, = args
+        start = segment_start(rows, period, 512)
+        if start is None:
+            return calc_vwma(close, data['volume'], period)[rows:], None
+        volume = np.asarray(data['volume'], dtype=np.float64)
+        return calc_vwma(close[start:], volume[start:], period)[rows - start:], None
+
+    if name == 'atr':
+        period, = args
+        if rows <= period:
+            return calc_atr(data['high'], data['low'], close, period)[rows:], None
+        high = np.asarray(data['high'], dtype=np.float64)[rows:]
+        low = np.asarray(data['low'], dtype=np.float64)[rows:]
+        prev_close = close[rows - 1:-1]
+        true_range = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+        return wilder_smooth(true_range, period, float(column[-1])), None
+
+    if name != 'std':
+        raise ValueError(f"Unknown indicator: {name}")
+    mode, period = args
+    if mode == 'rolling':
+        start = segment_start(rows, period, 512)
+        if start is None:
+            return calc_std(close, mode, period)[rows:], None
+        return np.sqrt(window_var(close[start:], period))[rows - start - period + 1:], None
+
+    if mode == 'expanding':
+        state = state or {'count': 0, 'mean': 0.0, 'm2': 0.0}
+        start = state['count']
+        result, (count, mean, m2) = expanding_var(close[start:], state=(start, state['mean'], state['m2']))
+        return np.sqrt(result[rows - start:]), {'count': count, 'mean': mean, 'm2': m2}
+
+    if state is None:
+        ewm = pd.Series(close).ewm(span=period, adjust=False)
+        var = ewm.var(bias=True).to_numpy()
+        state = {'count': len(close), 'mean': float(ewm.mean().iloc[-1]), 'm2': float(var[-1])} if len(close) else None
+        return np.sqrt(var[rows:]), state
+    running = RunningStd(mode, period)
+    running.count, running.mean, running.m2 = state['count'], state['mean'], state['m2']
+    values = np.array([running.update(value) for value in close[rows:].tolist()])
+    return values, {'count': running.count, 'mean': running.mean, 'm2': running.m2}
+
+
+# 续算窗口类指标时重算的起点：第一个新增窗口所在分段的起点（窗口按结束位置 - period + 1 编号）；
+# 已有数据不足一个窗口时返回 None，从头计算
+def segment_start(rows, period, block):
+    first = rows - period + 1
+    if first < 0:
+        return None
+    return first // block * block
+
+
+# 整表预计算：返回原数据列加上各指标列的新 DataFrame，原数据列不复制
+def precompute_indicators(data, specs):
+    columns = {column: data[column].to_numpy() for column in data.columns}
+    for spec in specs:
+        columns[indicator_column(spec)] = calc_indicator(data, spec)
+    return pd.DataFrame(columns, index=data.index, copy=False)
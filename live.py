@@ -0,0 +1,277 @@
+# live.py
+# 流式运行（模拟盘）：K线逐根从队列送入策略，不预加载、不走 runonce，策略类与离线回测完全相同，指标在 next() 中增量计算。
+# K线来源：
+#   queue   后台线程里的 asyncio 协程按节拍把K线放入队列
+#   socket  本地回放服务器（asyncio TCP）按节拍逐行发送 JSON，客户端线程收到后放入队列，代替券商行情推送
+# 延迟：每根K线到达（放入队列 / 从套接字收到）与被数据源取出时各打一个 perf_counter 时间戳，
+#   决策延迟 = 到达 → 策略 next() 执行完；下单延迟 = 到达 → buy()/sell() 返回（只统计有下单的K线）；
+#   处理耗时 = 取出 → next() 执行完。推送快于策略处理能力时K线在队列中积压，决策延迟随之增大，而处理耗时不受影响。
+#   由 LatencyAnalyzer 汇总 p50 / p99 / 最大值（微秒），预热期（未达最小周期）的K线不计入
+
+import io
+import json
+import time
+import queue
+import socket
+import asyncio
+import argparse
+import threading
+import contextlib
+import numpy as np
+import backtrader as bt
+from config import CONFIG
+from strategy import StrategyFactory
+from main import load_data
+from metrics import analyze
+from resample import resolve_data_file
+
+END = None
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+# 按节拍逐根产出 (时间, open, high, low, close, volume)；interval 为 0 时不等待
+async def paced_bars(data, interval):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    values = data[BAR_COLUMNS].to_numpy(dtype=np.float64)
+    for i, (dt, row) in enumerate(zip(data.index, values)):
+        if interval:
+            await asyncio.sleep(max(0.0, start + i * interval - loop.time()))
+        yield (dt.to_pydatetime(), *row.tolist())
+
+
+async def replay_to_queue(data, interval, bars):
+    async for bar in paced_bars(data, interval):
+        bars.put((*bar, time.perf_counter_ns()))
+    bars.put(END)
+
+
+# queue 来源：后台线程运行事件循环，把K线依次放入线程安全的队列
+def queue_source(data, interval):
+    bars = queue.Queue()
+    thread = threading.Thread(target=asyncio.run, args=(replay_to_queue(data, interval, bars),), daemon=True)
+    thread.start()
+    return bars, thread
+
+
+# 本地回放服务器：每个连接从头按节拍发送全部K线，每行一个 JSON 数组，结束时发送 null
+class ReplayServer:
+    def __init__(self, data, interval=0.0, host='127.0.0.1', port=0):
+        self.data = data
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.ready = threading.Event()
+        self.loop = None
+        self.stopped = None
+        self.thread = None
+
+    async def handle(self, reader, writer):
+        try:
+            async for dt, *row in paced_bars(self.data, self.interval):
+                writer.write(json.dumps([dt.isoformat(), *row]).encode() + b'\n')
+                await writer.drain()
+            writer.write(b'null\n')
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        async with server:
+            await self.stopped.wait()
+
+    def start(self):
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join()
+
+
+# socket 来源：客户端线程逐行读取，收到即打时间戳放入队列
+def socket_source(host, port):
+    bars = queue.Queue()
+
+    def read():
+        with socket.create_connection((host, port)) as conn, conn.makefile('rb') as lines:
+            for line in lines:
+                arrival = time.perf_counter_ns()
+                message = json.loads(line)
+                if message is None:
+                    break
+                dt, *row = message
+                bars.put((np.datetime64(dt).astype('datetime64[us]').item(), *row, arrival))
+        bars.put(END)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    return bars, thread
+
+
+# 从队列读取K线的实时数据源：队列中没有新K线时阻塞等待，超时或收到结束标记时结束
+class QueueData(bt.feed.DataBase):
+    params = (
+        ('queue', None),
+        ('timeout', None),
+    )
+
+    def islive(self):
+        return True
+
+    def start(self):
+        super().start()
+        self.arrival_ns = None
+        self.dequeued_ns = None
+
+    def _load(self):
+        try:
+            item = self.p.queue.get(timeout=self.p.timeout)
+        except queue.Empty:
+            return False
+        self.dequeued_ns = time.perf_counter_ns()
+        if item is END:
+            return False
+
+        dt, open_, high, low, close, volume, self.arrival_ns = item
+        self.lines.datetime[0] = bt.date2num(dt)
+        self.lines.open[0] = open_
+        self.lines.high[0] = high
+        self.lines.low[0] = low
+        self.lines.close[0] = close
+        self.lines.volume[0] = volume
+        self.lines.openinterest[0] = 0.0
+        return True
+
+
+# 在原策略类上记录下单时刻
+def timed_strategy(strategy_class):
+    class Timed(strategy_class):
+        emitted_ns = None
+
+        def buy(self, *args, **kwargs):
+            order = super().buy(*args, **kwargs)
+            self.emitted_ns = time.perf_counter_ns()
+            return order
+
+        def sell(self, *args, **kwargs):
+            order = super().sell(*args, **kwargs)
+            self.emitted_ns = time.perf_counter_ns()
+            return order
+
+    Timed.__name__ = strategy_class.__name__
+    Timed.__qualname__ = strategy_class.__qualname__
+    return Timed
+
+
+def latency_summary(samples):
+    if not samples:
+        return {'count': 0, 'p50_us': None, 'p99_us': None, 'max_us': None, 'mean_us': None}
+    values = np.asarray(samples, dtype=np.float64) / 1000.0
+    return {
+        'count': len(values),
+        'p50_us': float(np.percentile(values, 50)),
+        'p99_us': float(np.percentile(values, 99)),
+        'max_us': float(values.max()),
+        'mean_us': float(values.mean()),
+    }
+
+
+# 每根K线的决策延迟、下单延迟与处理耗时；分析器在策略 next() 之后执行，此时即为决策完成时刻
+class LatencyAnalyzer(bt.Analyzer):
+    def start(self):
+        self.decision = []
+        self.order = []
+        self.processing = []
+
+    def prenext(self):
+        pass
+
+    def next(self):
+        now = time.perf_counter_ns()
+        arrival = self.data.arrival_ns
+        self.decision.append(now - arrival)
+        self.processing.append(now - self.data.dequeued_ns)
+        emitted = self.strategy.emitted_ns
+        if emitted is not None and emitted >= self.data.dequeued_ns:
+            self.order.append(emitted - arrival)
+
+    def get_analysis(self):
+        return {
+            'decision': latency_summary(self.decision),
+            'order': latency_summary(self.order),
+            'processing': latency_summary(self.processing),
+        }
+
+
+# 流式运行一个策略，返回 (策略实例, 延迟统计)
+def run_live(strategy_name, timeframe, data, source='queue', interval=0.0, host='127.0.0.1', port=0, timeout=None):
+    strategy_params = (CONFIG['strategies'][strategy_name]['params'] or {}).get(timeframe, {})
+    server = None
+    if source == 'queue':
+        bars, reader = queue_source(data, interval)
+    elif source == 'socket':
+        server = ReplayServer(data, interval, host, port).start()
+        bars, reader = socket_source(host, server.port)
+    else:
+        raise ValueError(f"Unsupported live source: {source}")
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(CONFIG['initial_cash'])
+    cerebro.adddata(QueueData(queue=bars, timeout=timeout))
+    cerebro.addstrategy(timed_strategy(StrategyFactory.get_strategy(strategy_name)), timeframe=timeframe,
+                        **strategy_params)
+    cerebro.addanalyzer(LatencyAnalyzer, _name='latency')
+    try:
+        strategy = cerebro.run(preload=False, runonce=False)[0]
+    finally:
+        reader.join()
+        if server is not None:
+            server.stop()
+    return strategy, strategy.analyzers.latency.get_analysis()
+
+
+def main():
+    settings = CONFIG['live']
+    parser = argparse.ArgumentParser(description='流式运行策略并测量逐K线决策延迟')
+    parser.add_argument('--strategy', default=settings['strategy'])
+    parser.add_argument('--timeframe', default=settings['timeframe'])
+    parser.add_argument('--source', choices=['queue', 'socket'], default=settings['source'])
+    parser.add_argument('--interval', type=float, default=settings['interval'], help='推送间隔（秒），0 为不等待')
+    parser.add_argument('--bars', type=int, default=settings['bars'], help='只回放最后若干根K线，0 为全部')
+    parser.add_argument('--budget-ms', type=float, default=settings['budget_ms'], help='p99 决策延迟上限（毫秒）')
+    args = parser.parse_args()
+
+    data = load_data(resolve_data_file(args.timeframe))
+    if args.bars:
+        data = data.iloc[-args.bars:]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy, latency = run_live(args.strategy, args.timeframe, data, args.source, args.interval,
+                                     settings['host'], settings['port'], settings['timeout'])
+    metrics, _, _ = analyze(strategy.trade_recorder.get_analysis(), data.index, CONFIG['initial_cash'])
+
+    print(f"{args.strategy} {args.timeframe}（{args.source}，间隔 {args.interval}s）: {len(data)} 根K线，"
+          f"总收益率 {metrics['总收益率']:.2%}")
+    for name, label in (('decision', '决策延迟'), ('order', '下单延迟'), ('processing', '处理耗时')):
+        stats = latency[name]
+        if stats['count']:
+            print(f"    {label}: {stats['count']} 次，p50 {stats['p50_us']:.1f}us，p99 {stats['p99_us']:.1f}us，"
+                  f"最大 {stats['max_us']:.1f}us")
+
+    p99 = latency['decision']['p99_us']
+    if args.budget_ms and p99 is not None and p99 > args.budget_ms * 1000:
+        print(f"p99 决策延迟超出预算 {args.budget_ms}ms")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
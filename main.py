@@ -2,9 +2,18 @@
 import os
 import pandas as pd
 import backtrader as bt
+from concurrent.futures import ProcessPoolExecutor
 from config import CONFIG
 from strategy import StrategyFactory
+from datastore import load_processed, load_indicators
+from feeds import SharedPandasData, share_data, share_file, indicator_feed_class
+from indicators import indicator_column
+from resample import resolve_data_file
+from writers import TradeOutputWriter, filter_trades
 from analyzers import CustomDrawDown, CustomReturns, CustomTradeAnalyzer
+from metrics import analyze, EXTRA_METRICS
+from cache import result_key, load_result, store_result
+from profiling import profiled
 
 # 确保输出目录存在
 def ensure_dir(file_path):
@@ -15,20 +24,43 @@ def ensure_dir(file_path):
 
 
 def load_data(file_path):
-    data = pd.read_csv(file_path, index_col='datetime', parse_dates=True)
+    data = load_processed(file_path)
     # print(data.head())
     return data
 
 
-def run_strategy(data_file, strategy_name, strategy_params):
+# 策略用到的指标参数；未开启 precompute_indicators 时为空，指标在回测中计算
+def strategy_specs(strategy_name, strategy_params):
+    if not CONFIG.get('precompute_indicators'):
+        return []
+    strategy_class = StrategyFactory.get_strategy(strategy_name)
+    params = {**strategy_class.params._getpairs(), **strategy_params}
+    return strategy_class.indicator_specs(params)
+
+
+def run_strategy(data_file, strategy_name, strategy_params, shared=None, data_feed=None, trade_writer=None,
+                 initial_cash=None, timeframe=None):
     # 创建新的 Cerebro 实例
     cerebro = bt.Cerebro()
+    # 设置了分块写出时，策略的 TradeRecorder 边回测边落盘
+    cerebro.trade_writer = trade_writer
 
-    # 设置初始现金、佣金率、滑点
-    cerebro.broker.setcash(CONFIG['initial_cash'])
+    # 设置初始现金、佣金率、滑点；组合回测时按分配给该标的的资金设置
+    initial_cash = CONFIG['initial_cash'] if initial_cash is None else initial_cash
+    cerebro.broker.setcash(initial_cash)
 
-    # 加载数据
-    data = load_data(data_file)
+    # 加载数据：可直接传入已构建的数据源；shared 为共享数据的描述信息时直接挂载，不再读取文件。
+    # 开启指标预计算时，策略用到的指标作为额外的数据线传入，策略直接读取
+    if data_feed is None:
+        specs = strategy_specs(strategy_name, strategy_params)
+        feed_class = indicator_feed_class(tuple(indicator_column(spec) for spec in specs))
+        if shared is not None:
+            data_feed = feed_class(shared=shared)
+        elif specs:
+            data_feed = feed_class(dataname=load_indicators(data_file, specs))
+        else:
+            data_feed = bt.feeds.PandasData(dataname=load_data(data_file))
+    data = data_feed.p.dataname
     start_date = data.index[0].date()
     end_date = data.index[-1].date()
     num_years = (end_date - start_date).days / 365.25
@@ -36,32 +68,44 @@ def run_strategy(data_file, strategy_name, strategy_params):
     print(f'回测结束时间：{end_date}')
     print(f"交易年数: {num_years:.2f} 年")
 
-    # 添加分析器
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-    cerebro.addanalyzer(CustomDrawDown, _name='custom_drawdown')
-    cerebro.addanalyzer(CustomReturns, _name='custom_returns', num_years=num_years)
-    cerebro.addanalyzer(CustomTradeAnalyzer, _name='custom_trades')
+    # 添加分析器；关闭时指标在回测结束后由 metrics.py 从逐K线记录计算。
+    # 分块写出时记录不全在内存中，仍由分析器计算
+    if CONFIG['analyzers']['enabled'] or trade_writer is not None:
+        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
+        cerebro.addanalyzer(CustomDrawDown, _name='custom_drawdown')
+        # 分析器默认只保留累加量；capture 开启时额外保存逐K线收益与每笔交易
+        capture = CONFIG['analyzers']['capture']
+        cerebro.addanalyzer(CustomReturns, _name='custom_returns', num_years=num_years, capture=capture)
+        cerebro.addanalyzer(CustomTradeAnalyzer, _name='custom_trades', num_years=num_years, capture=capture)
     
-    data_feed = bt.feeds.PandasData(dataname=data)
     cerebro.adddata(data_feed)
 
-    # 加载参数和策略
-    timeframe = data_file.split('_')[-1].replace('.csv', '')
+    # 加载参数和策略；未指定时间框架时按数据文件名末尾推断
+    if timeframe is None:
+        timeframe = data_file.split('_')[-1].replace('.csv', '')
     strategy_class = StrategyFactory.get_strategy(strategy_name)
     cerebro.addstrategy(strategy_class, timeframe=timeframe, **strategy_params)
 
-    # 运行回测
-    initial_cash = CONFIG['initial_cash'] 
+    # 运行回测；开启 profiling 时统计各组件耗时并写出
     print(f"初始资金: {initial_cash:.2f}")
-    results = cerebro.run()
+    with profiled() as profiler:
+        results = cerebro.run()
+    if profiler is not None:
+        table_file, stack_file = profiler.save(f'{strategy_name}_{timeframe}')
+        print(f"耗时剖析已保存到: {table_file}, {stack_file}")
     final_value = cerebro.broker.get_value() 
     print(f"回测结束后的资金: {final_value:.2f}")
 
     return cerebro, results, num_years
 
-# 打印策略结果
-def print_analysis(results, num_years, strategy_name, data_name):
+# 从分析器中取出数值形式的指标；未添加分析器时由逐K线记录计算
+def get_metrics(results):
     results = results[0]
+    if not len(results.analyzers):
+        data = results.datas[0].p.dataname
+        metrics, _, _ = analyze(results.trade_recorder.get_analysis(), data.index, results.broker.startingcash,
+                                rolling_years=CONFIG['analyzers']['rolling_years'])
+        return {key: value for key, value in metrics.items() if key not in EXTRA_METRICS}
 
     # 获取分析结果
     sharpe_ratio = results.analyzers.sharpe.get_analysis().get('sharperatio', 0)
@@ -69,20 +113,45 @@ def print_analysis(results, num_years, strategy_name, data_name):
     custom_returns = results.analyzers.custom_returns.get_analysis()
     custom_trade_analysis = results.analyzers.custom_trades.get_analysis()
 
+    return {
+        # 重要指标
+        "总收益率": custom_returns.get('roi', 0),
+        "年化收益率": custom_returns.get('annualized_roi', 0),
+        "最大回撤": custom_drawdown.get('max', {}).get('drawdown', 0),
+        "夏普比率": sharpe_ratio,
+        # 其他指标
+        "年均交易次数": custom_trade_analysis.get('annual_trade_count',0),
+        "胜率": custom_trade_analysis.get('win_rate',0),
+        "盈亏比": custom_trade_analysis.get('profit_factor',0),
+        "最大回撤持续K线根数": custom_drawdown.get('max', {}).get('len', 0),
+        "最大回撤开始时间": custom_drawdown.get('max', {}).get('datetime', 'N/A'),
+        "最大回撤结束时间": custom_drawdown.get('max', {}).get('recovery', 'N/A'),
+        "盈利交易的平均持仓K线根数": custom_trade_analysis.get('avg_winning_trade_bars', 0),
+        "索提诺比率": custom_returns.get('sortino', 0),
+        "年化波动率": custom_returns.get('volatility', 0),
+    }
+
+# 打印策略结果
+def print_analysis(results, num_years, strategy_name, data_name):
+    metrics = get_metrics(results)
+
     # 从分析器获取数据
     # 重要指标
-    total_return = custom_returns.get('roi', 0)
-    annual_return = custom_returns.get('annualized_roi', 0)
-    max_drawdown = custom_drawdown.get('max', {}).get('drawdown', 0)
+    total_return = metrics["总收益率"]
+    annual_return = metrics["年化收益率"]
+    max_drawdown = metrics["最大回撤"]
+    sharpe_ratio = metrics["夏普比率"]
 
     # 其他指标
-    annual_trade_count = custom_trade_analysis.get('annual_trade_count',0)
-    win_rate = custom_trade_analysis.get('win_rate',0)
-    profit_factor = custom_trade_analysis.get('profit_factor',0)
-    max_drawdown_duration = custom_drawdown.get('max', {}).get('len', 0)
-    max_drawdown_start = custom_drawdown.get('max', {}).get('datetime', 'N/A')
-    max_drawdown_end = custom_drawdown.get('max', {}).get('recovery', 'N/A')
-    avg_winning_trade_bars = custom_trade_analysis.get('avg_winning_trade_bars', 0)
+    annual_trade_count = metrics["年均交易次数"]
+    win_rate = metrics["胜率"]
+    profit_factor = metrics["盈亏比"]
+    max_drawdown_duration = metrics["最大回撤持续K线根数"]
+    max_drawdown_start = metrics["最大回撤开始时间"]
+    max_drawdown_end = metrics["最大回撤结束时间"]
+    avg_winning_trade_bars = metrics["盈利交易的平均持仓K线根数"]
+    sortino_ratio = metrics["索提诺比率"]
+    volatility = metrics["年化波动率"]
 
     # 创建结果字典
     analysis_results = {
@@ -101,11 +170,18 @@ def print_analysis(results, num_years, strategy_name, data_name):
             "最大回撤持续K线根数": max_drawdown_duration,
             "最大回撤开始时间": max_drawdown_start,
             "最大回撤结束时间": max_drawdown_end,
-            "盈利交易的平均持仓K线根数": avg_winning_trade_bars
+            "盈利交易的平均持仓K线根数": avg_winning_trade_bars,
+            "索提诺比率": f"{sortino_ratio:.2f}",
+            "年化波动率": f"{volatility:.2%}"
         }
     }
 
-    # 打印结果
+    show_analysis(analysis_results)
+    return analysis_results
+
+
+# 打印结果
+def show_analysis(analysis_results):
     print("\n重要指标：")
     for key, value in analysis_results["重要指标"].items():
         print(f"    {key}: {value}")
@@ -114,46 +190,157 @@ def print_analysis(results, num_years, strategy_name, data_name):
     for key, value in analysis_results["其他指标"].items():
         print(f"    {key}: {value}")
 
-    return analysis_results
+# 单个回测任务：可在子进程中运行，只返回可序列化的交易记录与分析结果；
+# 开启分块写出时记录已在回测中落盘，返回的交易记录为 None
+def run_job(job, shared=None):
+    strategy_name, timeframe, data_file, strategy_params = job
 
-def main():
-    # 运行所有策略组合
+    trade_writer = open_trade_writer(job) if CONFIG['stream_output']['enabled'] else None
+
+    print(f"数据: {data_file} \n运行策略: {strategy_name}")
+    cerebro, results, num_years = run_strategy(data_file, strategy_name, strategy_params, shared,
+                                               trade_writer=trade_writer, timeframe=timeframe)
+
+    strategy = results[0]
+    if trade_writer is not None:
+        strategy.trade_recorder.close()
+        df = None
+    else:
+        df = strategy.trade_recorder.get_analysis()
+    analysis_results = print_analysis(results, num_years, strategy_name, data_file)
+    print(f"——————————————————————————————————————————————————————————————")
+
+    return df, analysis_results
+
+
+# 按配置展开 策略 × 时间框架 的回测任务列表，顺序即结果顺序；
+# data_files 中没有的时间框架由基础数据聚合得到
+def build_jobs():
+    jobs = []
     for strategy_name, strategy_config in CONFIG['strategies'].items():
         for timeframe in strategy_config['enabled_timeframes']:
-            data_file = CONFIG['data_files'][f'qqq_{timeframe}']
-            
-            target = data_file.split('_')[1]
-            
+            data_file = resolve_data_file(timeframe)
             strategy_params = strategy_config['params'][timeframe] if strategy_config['params'] else {}
+            jobs.append((strategy_name, timeframe, data_file, strategy_params))
+    return jobs
 
-            print(f"数据: {data_file} \n运行策略: {strategy_name}")
-            cerebro, results, num_years = run_strategy(data_file, strategy_name, strategy_params)
-        
-            strategy = results[0]
-            df = strategy.trade_recorder.get_analysis()
-            filtered_df = df[df['交易状态'].isin(['买', '加', '卖'])].copy()
-            filtered_df = filtered_df.reset_index(drop=True)
-            filtered_df.index = filtered_df.index + 1
-
-            columns_to_drop = ['open', 'high', 'low', 'close','资金利用率']
-            filtered_df = filtered_df.drop(columns=columns_to_drop, errors='ignore')
-
-            df['策略'] = strategy_name
-            df['时间框架'] = timeframe
-            filtered_df['策略'] = strategy_name
-            filtered_df['时间框架'] = timeframe
-
-            output_file = f"{CONFIG['output_dir']}{strategy_name}_{timeframe}_{target}_trades.csv"
-            ensure_dir(output_file)
-            filtered_df.to_csv(output_file, encoding='utf-8-sig')
-            print(f"\n交易记录已保存到: {output_file}")
-
-            output_df = f"{CONFIG['df_dir']}{strategy_name}_{timeframe}_{target}_all_trades.csv"
-            ensure_dir(output_df)
-            df.to_csv(output_df, encoding='utf-8-sig')
-            print(f"可视化数据已保存到: {output_df}")
-            
+
+# 运行全部任务，结果顺序与任务顺序一致；开启结果缓存时输入未变的任务直接取缓存，只运行其余任务。
+# 分块写出时结果已在回测中落盘，不经过缓存
+def run_jobs(jobs, workers=None):
+    if not CONFIG['result_cache']['enabled'] or CONFIG['stream_output']['enabled']:
+        return execute_jobs(jobs, workers)
+
+    keys = [result_key(job) for job in jobs]
+    outputs = [load_result(key) for key in keys]
+    for job, output in zip(jobs, outputs):
+        if output is not None:
+            print(f"数据: {job[2]} \n策略: {job[0]}（输入未变，使用缓存结果）")
+            show_analysis(output[1])
             print(f"——————————————————————————————————————————————————————————————")
 
+    pending = [i for i, output in enumerate(outputs) if output is None]
+    for i, output in zip(pending, execute_jobs([jobs[i] for i in pending], workers)):
+        store_result(keys[i], *output)
+        outputs[i] = output
+    return outputs
+
+
+# 运行任务：workers 为 1 时串行，否则分发到进程池；结果顺序与任务顺序一致
+def execute_jobs(jobs, workers=None):
+    if not jobs:
+        return []
+    if workers is None:
+        workers = CONFIG['workers']
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    if workers == 1 or len(jobs) <= 1:
+        return [run_job(job) for job in jobs]
+
+    # 同一数据文件只加载一次，所有子进程共享同一份内存；
+    # 用到同一数据文件的各任务所需指标合并后一起预计算并共享，每个指标只算一次
+    file_specs = {}
+    for strategy_name, _, data_file, strategy_params in jobs:
+        specs = file_specs.setdefault(data_file, [])
+        specs += [spec for spec in strategy_specs(strategy_name, strategy_params) if spec not in specs]
+
+    shared_blocks = []
+    shared = {}
+    try:
+        for data_file, specs in file_specs.items():
+            if CONFIG['shared_data'] == 'shm':
+                data = load_indicators(data_file, specs) if specs else load_data(data_file)
+                shm, shared[data_file] = share_data(data)
+                shared_blocks.append(shm)
+            elif CONFIG['shared_data'] == 'mmap':
+                shared[data_file] = share_file(data_file, specs)
+            else:
+                shared[data_file] = None
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            return list(executor.map(run_job, jobs, [shared[job[2]] for job in jobs]))
+    finally:
+        for shm in shared_blocks:
+            shm.close()
+            shm.unlink()
+
+
+# 输出文件路径：交易记录、可视化数据
+def output_paths(job):
+    strategy_name, timeframe, data_file, _ = job
+    target = data_file.split('_')[1]
+
+    output_file = f"{CONFIG['output_dir']}{strategy_name}_{timeframe}_{target}_trades.csv"
+    output_df = f"{CONFIG['df_dir']}{strategy_name}_{timeframe}_{target}_all_trades.csv"
+    return output_file, output_df
+
+
+# 分块写出：列式格式时输出为同名目录（去掉 .csv 后缀）
+def open_trade_writer(job):
+    strategy_name, timeframe, _, _ = job
+    settings = CONFIG['stream_output']
+    output_file, output_df = output_paths(job)
+    if settings['format'] != 'csv':
+        output_file, output_df = output_file[:-len('.csv')], output_df[:-len('.csv')]
+
+    return TradeOutputWriter(output_df, output_file, strategy_name, timeframe,
+                             chunk_size=settings['chunk_size'], fmt=settings['format'])
+
+
+# 保存交易记录与可视化数据
+def save_results(job, df):
+    strategy_name, timeframe, _, _ = job
+    output_file, output_df = output_paths(job)
+
+    filtered_df = filter_trades(df).reset_index(drop=True)
+    filtered_df.index = filtered_df.index + 1
+
+    df['策略'] = strategy_name
+    df['时间框架'] = timeframe
+    filtered_df['策略'] = strategy_name
+    filtered_df['时间框架'] = timeframe
+
+    ensure_dir(output_file)
+    filtered_df.to_csv(output_file, encoding='utf-8-sig')
+    print(f"\n交易记录已保存到: {output_file}")
+
+    ensure_dir(output_df)
+    df.to_csv(output_df, encoding='utf-8-sig')
+    print(f"可视化数据已保存到: {output_df}")
+
+
+def main():
+    # 运行所有策略组合
+    jobs = build_jobs()
+    outputs = run_jobs(jobs)
+
+    for job, (df, analysis_results) in zip(jobs, outputs):
+        if df is not None:
+            save_results(job, df)
+        else:
+            output_file, output_df = output_paths(job)
+            print(f"\n{job[0]} {job[1]} 交易记录与可视化数据已分块写出到: {output_file}, {output_df}")
+
 if __name__ == '__main__':
     main()
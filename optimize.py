@@ -0,0 +1,173 @@
+# optimize.py
+# 参数寻优：在参数范围内做网格 / 随机 / 拉丁超立方采样，多进程回测，按指标排序输出结果表。
+# 指标参数相同的组合归为一组，同组只预计算一次指标列，组内各次回测直接读取。
+# engine 为 vectorized 时组内改用 vectorized.screen：只有阈值参数（如 k）不同的组合在一次数据遍历中同时回测
+
+import os
+import io
+import math
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from strategy import StrategyFactory
+from indicators import precompute_indicators, indicator_column
+from feeds import attach_data, share_file, indicator_feed_class
+from main import run_strategy, get_metrics, ensure_dir
+from resample import resolve_data_file
+from vectorized import screen, SUPPORTED_STRATEGIES
+
+# 数值越小越好的指标，排序时升序
+ASCENDING_METRICS = ('最大回撤', '最大回撤持续K线根数')
+
+
+# 参数空间的写法：
+#   列表 [a, b, c]       离散取值
+#   (low, high)         随机 / 拉丁超立方采样的连续区间，两端均为整数时按整数采样
+#   (low, high, num)    网格搜索时在区间内等间距取 num 个值
+def grid_values(values):
+    if isinstance(values, tuple):
+        low, high, num = values
+        points = np.linspace(low, high, num)
+        if isinstance(low, int) and isinstance(high, int):
+            return sorted(set(int(round(point)) for point in points))
+        return points.tolist()
+    return list(values)
+
+
+# 把 [0, 1) 内的采样点映射为参数取值
+def scale_value(values, u):
+    if isinstance(values, tuple):
+        low, high = values[:2]
+        if isinstance(low, int) and isinstance(high, int):
+            return low + min(int(u * (high - low + 1)), high - low)
+        return float(low + u * (high - low))
+    values = list(values)
+    return values[min(int(u * len(values)), len(values) - 1)]
+
+
+def sample_params(space, method='grid', samples=None, seed=None):
+    names = list(space)
+    if method == 'grid':
+        grids = [grid_values(space[name]) for name in names]
+        return [dict(zip(names, combo)) for combo in itertools.product(*grids)]
+
+    rng = np.random.default_rng(seed)
+    if method == 'random':
+        points = rng.random((samples, len(names)))
+    elif method == 'lhs':
+        # 拉丁超立方：每个参数的 [0, 1) 等分为 samples 段，每段恰好落一个点
+        strata = rng.permuted(np.tile(np.arange(samples), (len(names), 1)), axis=1).T
+        points = (strata + rng.random((samples, len(names)))) / samples
+    else:
+        raise ValueError(f"Unsupported optimization method: {method}")
+
+    combos = [{name: scale_value(space[name], u) for name, u in zip(names, row)} for row in points]
+    # 离散参数可能采到重复组合，只保留一次
+    unique = {tuple(combo.items()): combo for combo in combos}
+    return list(unique.values())
+
+
+# 按策略用到的指标分组；组数少于进程数时拆分大组，保证每个进程都有任务
+def group_params(strategy_class, param_list, workers):
+    groups = {}
+    for params in param_list:
+        specs = tuple(strategy_class.indicator_specs(params))
+        groups.setdefault(specs, []).append(params)
+
+    chunk_size = max(1, math.ceil(len(param_list) / workers))
+    tasks = []
+    for specs, members in groups.items():
+        for i in range(0, len(members), chunk_size):
+            tasks.append((specs, members[i:i + chunk_size]))
+    return tasks
+
+
+# 在给定数据上回测一组指标相同的参数组合：指标列只预计算一次
+def evaluate_params(strategy_name, data_file, timeframe, data, specs, param_list, engine='backtrader'):
+    if engine == 'vectorized':
+        return screen(strategy_name, data, param_list).to_dict('records')
+
+    data = precompute_indicators(data, specs)
+    feed_class = indicator_feed_class(tuple(indicator_column(spec) for spec in specs))
+
+    rows = []
+    for params in param_list:
+        with contextlib.redirect_stdout(io.StringIO()):
+            cerebro, results, num_years = run_strategy(data_file, strategy_name, params,
+                                                       data_feed=feed_class(dataname=data), timeframe=timeframe)
+        rows.append({**params, **get_metrics(results), '最终资金': cerebro.broker.get_value()})
+    return rows
+
+
+# 排序结果表，排名从1开始
+def rank_table(rows, sort_by):
+    table = pd.DataFrame(rows)
+    table = table.sort_values(sort_by, ascending=sort_by in ASCENDING_METRICS, kind='stable')
+    table = table.reset_index(drop=True)
+    table.index = table.index + 1
+    table.index.name = '排名'
+    return table
+
+
+# 单个任务：挂载共享数据后回测本组参数
+def run_task(task):
+    strategy_name, data_file, timeframe, shared, specs, param_list, engine = task
+
+    shm, data = attach_data(shared)
+    return evaluate_params(strategy_name, data_file, timeframe, data, specs, param_list, engine)
+
+
+# 运行寻优，返回按 sort_by 排序的结果表
+def optimize(strategy_name, timeframe, space, method='grid', samples=None, seed=None,
+             workers=None, sort_by='年化收益率', engine='backtrader'):
+    if engine not in ('backtrader', 'vectorized'):
+        raise ValueError(f"Unsupported optimization engine: {engine}")
+    if engine == 'vectorized' and strategy_name not in SUPPORTED_STRATEGIES:
+        raise ValueError(f"Strategy '{strategy_name}' has no vectorized implementation")
+    strategy_class = StrategyFactory.get_strategy(strategy_name)
+    data_file = resolve_data_file(timeframe)
+    base_params = (CONFIG['strategies'][strategy_name]['params'] or {}).get(timeframe, {})
+
+    if workers is None:
+        workers = CONFIG['workers']
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    param_list = [{**base_params, **combo} for combo in sample_params(space, method, samples, seed)]
+    shared = share_file(data_file)
+    tasks = [
+        (strategy_name, data_file, timeframe, shared, specs, members, engine)
+        for specs, members in group_params(strategy_class, param_list, workers)
+    ]
+    print(f"参数组合: {len(param_list)} 个，指标分组任务: {len(tasks)} 个")
+
+    if workers == 1 or len(tasks) <= 1:
+        outputs = [run_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            outputs = list(executor.map(run_task, tasks))
+
+    return rank_table([row for rows in outputs for row in rows], sort_by)
+
+
+def main():
+    settings = CONFIG['optimization']
+    strategy_name = settings['strategy']
+    timeframe = settings['timeframe']
+
+    table = optimize(strategy_name, timeframe, settings['params'], method=settings['method'],
+                     samples=settings.get('samples'), seed=settings.get('seed'),
+                     sort_by=settings['sort_by'], engine=settings.get('engine', 'backtrader'))
+
+    output_file = f"{CONFIG['output_dir']}optimize_{strategy_name}_{timeframe}_{settings['method']}.csv"
+    ensure_dir(output_file)
+    table.to_csv(output_file, encoding='utf-8-sig')
+    print(table.head(10).to_string())
+    print(f"\n寻优结果已保存到: {output_file}")
+
+
+if __name__ == '__main__':
+    main()
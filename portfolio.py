@@ -0,0 +1,171 @@
+# portfolio.py
+# 多标的组合回测：按文件名模式收集各标的的处理后数据，按配置把初始资金分配给各标的，
+# 每个标的在自己的资金账户上独立回测，再把各账户的资金曲线按时间对齐相加得到组合资金曲线。
+# 标的按批分给子进程，每个进程同一时间只加载一个标的的数据，回测完只保留资金曲线与指标，
+# 组合曲线在主进程逐批累加，标的数量再多内存也只与单个标的的数据量和组合曲线长度有关
+
+import os
+import io
+import glob
+import math
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from main import run_strategy, get_metrics, save_results, ensure_dir
+from walkforward import equity_curve
+
+
+# 标的名取自文件名：processed/<交易所>_<标的>_<时间框架>.csv
+def symbol_name(file_path):
+    parts = os.path.splitext(os.path.basename(file_path))[0].split('_')
+    return parts[-2] if len(parts) >= 3 else parts[0]
+
+
+# 按模式收集数据文件，返回 {标的: 文件}，按标的排序
+def discover_files(pattern, timeframe):
+    files = {symbol_name(path): path for path in glob.glob(pattern.format(timeframe=timeframe))}
+    return dict(sorted(files.items()))
+
+
+# 资金分配：'equal' 等权，或 {标的: 权重}（按权重之和归一，未列出的标的不参与）
+def allocate(symbols, allocation, total_cash):
+    if allocation == 'equal':
+        weights = {symbol: 1.0 for symbol in symbols}
+    else:
+        weights = {symbol: float(allocation.get(symbol, 0.0)) for symbol in symbols}
+    weights = {symbol: weight for symbol, weight in weights.items() if weight > 0}
+    if not weights:
+        raise ValueError("No symbol has a positive allocation")
+
+    total_weight = sum(weights.values())
+    return {symbol: total_cash * weight / total_weight for symbol, weight in weights.items()}
+
+
+# 一批标的：逐个回测，每个标的只返回指标与资金曲线
+def run_batch(task):
+    strategy_name, timeframe, strategy_params, batch, save_details = task
+
+    outputs = []
+    for symbol, data_file, cash in batch:
+        with contextlib.redirect_stdout(io.StringIO()):
+            cerebro, results, num_years = run_strategy(data_file, strategy_name, strategy_params,
+                                                       initial_cash=cash, timeframe=timeframe)
+            df = results[0].trade_recorder.get_analysis()
+            if save_details:
+                save_results((strategy_name, timeframe, data_file, strategy_params), df)
+
+        equity = equity_curve(df, results[0].datas[0].p.dataname.index, cash)
+        metrics = {
+            '标的': symbol,
+            '分配资金': cash,
+            **get_metrics(results),
+            '最终资金': cerebro.broker.get_value(),
+        }
+        outputs.append((metrics, equity))
+    return outputs
+
+
+# 把一个标的的资金曲线加入组合曲线：两者按时间并集对齐，各自向前填充，
+# 开始之前按初始资金计（included_cash 为已加入组合的各标的初始资金之和）
+def add_equity(total, equity, included_cash, cash):
+    if total is None:
+        return equity
+    index = total.index.union(equity.index)
+    total = total.reindex(index).ffill().fillna(included_cash)
+    equity = equity.reindex(index).ffill().fillna(cash)
+    return total + equity
+
+
+# 组合资金曲线的汇总指标；夏普比率按日收益年化
+def portfolio_stats(equity, initial_cash):
+    values = equity.to_numpy()
+    peak = np.maximum.accumulate(values)
+    num_years = (equity.index[-1].date() - equity.index[0].date()).days / 365.25
+    roi = float(values[-1] / initial_cash - 1.0)
+
+    daily_returns = equity.resample('D').last().dropna().pct_change().dropna()
+    std = daily_returns.std()
+    return {
+        '总收益率': roi,
+        '年化收益率': (1.0 + roi) ** (1 / num_years) - 1.0 if num_years > 0 else 0,
+        '最大回撤': float(np.max((peak - values) / peak)),
+        '夏普比率': float(daily_returns.mean() / std * math.sqrt(252)) if std > 0 else 0,
+        '最终资金': float(values[-1]),
+        '年数': num_years,
+    }
+
+
+def run_portfolio(strategy_name, timeframe, files, allocation='equal', batch_size=10, workers=None,
+                  save_details=False):
+    strategy_params = (CONFIG['strategies'][strategy_name]['params'] or {}).get(timeframe, {})
+    cash = allocate(list(files), allocation, CONFIG['initial_cash'])
+    symbols = [(symbol, files[symbol], symbol_cash) for symbol, symbol_cash in cash.items()]
+
+    if workers is None:
+        workers = CONFIG['workers']
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    tasks = [
+        (strategy_name, timeframe, strategy_params, symbols[i:i + batch_size], save_details)
+        for i in range(0, len(symbols), batch_size)
+    ]
+    print(f"标的: {len(symbols)} 个，分为 {len(tasks)} 批")
+
+    rows = []
+    total = None
+    included_cash = 0.0
+
+    def collect(outputs):
+        nonlocal total, included_cash
+        for metrics, equity in outputs:
+            total = add_equity(total, equity, included_cash, metrics['分配资金'])
+            included_cash += metrics['分配资金']
+            rows.append(metrics)
+            print(f"    {metrics['标的']}: 总收益率 {metrics['总收益率']:.2%}，最大回撤 {metrics['最大回撤']:.2%}")
+
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            collect(run_batch(task))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            for outputs in executor.map(run_batch, tasks):
+                collect(outputs)
+
+    table = pd.DataFrame(rows).set_index('标的')
+    table['资金占比'] = table['分配资金'] / CONFIG['initial_cash']
+    total = total.rename('总资产')
+    total.index.name = '时间'
+    return table, total, portfolio_stats(total, CONFIG['initial_cash'])
+
+
+def main():
+    settings = CONFIG['portfolio']
+    strategy_name = settings['strategy']
+    timeframe = settings['timeframe']
+
+    files = discover_files(settings['files'], timeframe)
+    if not files:
+        raise ValueError(f"No data files match {settings['files'].format(timeframe=timeframe)}")
+
+    table, equity, stats = run_portfolio(strategy_name, timeframe, files, settings['allocation'],
+                                         settings['batch_size'], save_details=settings['save_details'])
+
+    output_file = f"{CONFIG['output_dir']}portfolio_{strategy_name}_{timeframe}.csv"
+    equity_file = f"{CONFIG['output_dir']}portfolio_{strategy_name}_{timeframe}_equity.csv"
+    ensure_dir(output_file)
+    table.to_csv(output_file, encoding='utf-8-sig')
+    equity.to_csv(equity_file, encoding='utf-8-sig')
+
+    print(table[['分配资金', '总收益率', '年化收益率', '最大回撤', '夏普比率', '最终资金']].to_string())
+    print("\n组合汇总：")
+    for key, value in stats.items():
+        print(f"    {key}: {value:.4f}")
+    print(f"\n各标的结果已保存到: {output_file}")
+    print(f"组合资金曲线已保存到: {equity_file}")
+
+
+if __name__ == '__main__':
+    main()
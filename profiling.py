@@ -0,0 +1,173 @@
+# profiling.py
+# 回测热点剖析：临时替换 backtrader 各基类的回调（策略 / 指标 / 观察器的 next、once，分析器的 next、notify_*，
+# 策略的订单通知，券商的 next，数据源的 load / preload）与 TradeRecorder 的记录方法，
+# 按 "实际类名.回调" 统计调用次数、总耗时与自身耗时（扣除嵌套在其中的其他被统计回调），
+# 输出按自身耗时排序的分组件表，以及可直接交给 flamegraph.pl / speedscope 的折叠调用栈（单位：微秒）。
+# 只在 profiled() 作用域内替换，关闭时不改动任何类，没有额外开销
+
+import os
+import io
+import time
+import argparse
+import functools
+import contextlib
+from collections import defaultdict
+import pandas as pd
+import backtrader as bt
+from config import CONFIG
+from strategy import TradeRecorder
+
+# (基类, 方法名, 显示名)；基类的子类中自行定义了同名方法的也一并替换
+TARGETS = [
+    (bt.Cerebro, 'run', 'run'),
+    (bt.LineIterator, '_next', 'next'),
+    (bt.LineIterator, '_once', 'once'),
+    (bt.Strategy, '_oncepost', 'next'),
+    (bt.Strategy, '_notify', 'notify'),
+    (bt.Analyzer, '_prenext', 'prenext'),
+    (bt.Analyzer, '_nextstart', 'nextstart'),
+    (bt.Analyzer, '_next', 'next'),
+    (bt.Analyzer, '_notify_order', 'notify_order'),
+    (bt.Analyzer, '_notify_trade', 'notify_trade'),
+    (bt.Analyzer, '_notify_cashvalue', 'notify_cashvalue'),
+    (bt.Analyzer, '_notify_fund', 'notify_fund'),
+    (bt.Analyzer, '_stop', 'stop'),
+    (bt.brokers.BackBroker, 'next', 'next'),
+    (bt.feed.AbstractDataBase, 'preload', 'preload'),
+    (bt.feed.AbstractDataBase, 'load', 'load'),
+    (TradeRecorder, 'record', 'record'),
+    (TradeRecorder, 'get_analysis', 'get_analysis'),
+]
+
+
+def defining_classes(base, name):
+    classes, pending = [], [base]
+    while pending:
+        cls = pending.pop()
+        if name in vars(cls):
+            classes.append(cls)
+        pending += cls.__subclasses__()
+    return classes
+
+
+class Profiler:
+    def __init__(self, targets=None):
+        self.targets = TARGETS if targets is None else targets
+        self.calls = defaultdict(int)
+        self.total = defaultdict(int)
+        self.own = defaultdict(int)
+        self.stacks = defaultdict(int)
+        # 调用栈：每帧为 [名称, 子调用耗时, 对象, 显示名]
+        self.stack = []
+        self.patched = []
+
+    def wrap(self, method, label):
+        calls, total, own, stacks, stack = self.calls, self.total, self.own, self.stacks, self.stack
+        clock = time.perf_counter_ns
+
+        @functools.wraps(method)
+        def wrapper(obj, *args, **kwargs):
+            # 子类经 super() 调用基类的同一回调时只计一次
+            if stack and stack[-1][2] is obj and stack[-1][3] == label:
+                return method(obj, *args, **kwargs)
+            frame = [f'{type(obj).__name__}.{label}', 0, obj, label]
+            stack.append(frame)
+            start = clock()
+            try:
+                return method(obj, *args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                path = tuple(f[0] for f in stack)
+                stack.pop()
+                name = frame[0]
+                calls[name] += 1
+                total[name] += elapsed
+                own[name] += elapsed - frame[1]
+                stacks[path] += elapsed - frame[1]
+                if stack:
+                    stack[-1][1] += elapsed
+        return wrapper
+
+    def start(self):
+        for base, name, label in self.targets:
+            for cls in defining_classes(base, name):
+                original = vars(cls)[name]
+                self.patched.append((cls, name, original))
+                setattr(cls, name, self.wrap(original, label))
+
+    def stop(self):
+        for cls, name, original in reversed(self.patched):
+            setattr(cls, name, original)
+        self.patched.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # 分组件表：自身耗时占全部被统计时间的比例，按自身耗时降序
+    def table(self):
+        rows = [{
+            '组件': name,
+            '调用次数': self.calls[name],
+            '总耗时(s)': self.total[name] / 1e9,
+            '自身耗时(s)': self.own[name] / 1e9,
+            '单次耗时(us)': self.total[name] / self.calls[name] / 1e3,
+        } for name in self.calls]
+        table = pd.DataFrame(rows, columns=['组件', '调用次数', '总耗时(s)', '自身耗时(s)', '单次耗时(us)'])
+        own_total = table['自身耗时(s)'].sum()
+        table['自身占比'] = table['自身耗时(s)'] / own_total if own_total else 0.0
+        return table.sort_values('自身耗时(s)', ascending=False).reset_index(drop=True)
+
+    # 折叠调用栈：每行 "外层;内层;... 自身耗时(微秒)"
+    def collapsed(self):
+        return ''.join(f"{';'.join(path)} {value // 1000}\n"
+                       for path, value in sorted(self.stacks.items()) if value >= 1000)
+
+    def save(self, name, directory=None):
+        directory = directory or os.path.join(CONFIG['output_dir'], 'profile')
+        os.makedirs(directory, exist_ok=True)
+        table_file = os.path.join(directory, f'{name}.csv')
+        stack_file = os.path.join(directory, f'{name}.folded')
+        self.table().to_csv(table_file, index=False, encoding='utf-8-sig')
+        with open(stack_file, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        return table_file, stack_file
+
+
+# 开启 profiling 时返回 Profiler，否则返回不做任何事的上下文
+def profiled(enabled=None):
+    if enabled is None:
+        enabled = CONFIG['profiling']['enabled']
+    return Profiler() if enabled else contextlib.nullcontext()
+
+
+def main():
+    from main import run_strategy
+    from resample import resolve_data_file
+
+    parser = argparse.ArgumentParser(description='剖析一次回测中各组件的耗时')
+    parser.add_argument('--strategy', default='SupertrendATR')
+    parser.add_argument('--timeframe', default='5min')
+    parser.add_argument('--no-precompute', action='store_true', help='指标在回测中逐K线计算')
+    parser.add_argument('--no-analyzers', action='store_true', help='不挂分析器，只统计策略本身')
+    parser.add_argument('--top', type=int, default=CONFIG['profiling']['top'])
+    args = parser.parse_args()
+
+    CONFIG['precompute_indicators'] = not args.no_precompute and CONFIG['precompute_indicators']
+    CONFIG['analyzers']['enabled'] = CONFIG['analyzers']['enabled'] and not args.no_analyzers
+    strategy_params = (CONFIG['strategies'][args.strategy]['params'] or {}).get(args.timeframe, {})
+
+    with Profiler() as profiler, contextlib.redirect_stdout(io.StringIO()):
+        run_strategy(resolve_data_file(args.timeframe), args.strategy, strategy_params, timeframe=args.timeframe)
+
+    print(profiler.table().head(args.top).to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+    table_file, stack_file = profiler.save(f'{args.strategy}_{args.timeframe}')
+    print(f"\n分组件耗时已保存到: {table_file}")
+    print(f"折叠调用栈已保存到: {stack_file}")
+
+
+if __name__ == '__main__':
+    main()
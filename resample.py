@@ -0,0 +1,113 @@
+# resample.py
+# 由最细的基础数据（如 5min）按需聚合出更粗的时间框架（15min / 60min / 240min / 1d ...），不再为每个时间框架单独准备 CSV。
+# 纯 NumPy 分组聚合：开=桶内首根开盘，高=最高，低=最低，收=末根收盘，量=合计，atr 按聚合后的K线重新计算。
+# 桶默认从每个交易日的第一根K线起按周期划分（anchor='session'，与 processed/ 中 240min 数据的划分方式一致，
+# 夏令时切换后依然按开盘对齐），也可从每天 0 点起对齐（anchor='midnight'）；时间标记为桶的起点。
+# 聚合结果按 processed/ 的命名规则写成 CSV 放在 cache_dir/resampled/ 下，之后与普通数据文件一样经 datastore 缓存；
+# 基础数据内容变化时重新生成
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from datastore import load_processed, data_hash
+from indicators import calc_seeded_atr
+
+DAY = pd.Timedelta(days=1)
+
+
+# 时间框架写法：'15min'、'4h'、'1d'
+def parse_timeframe(timeframe):
+    for unit, suffix in (('min', 'min'), ('h', 'h'), ('D', 'd')):
+        if timeframe.endswith(suffix) and timeframe[:-len(suffix)].isdigit():
+            return pd.Timedelta(int(timeframe[:-len(suffix)]), unit=unit)
+    raise ValueError(f"Unsupported timeframe: {timeframe}")
+
+
+# 每根K线所属桶的起点（int64 纳秒）；数据按时间升序
+def bucket_starts(index, freq, anchor='session'):
+    if freq > DAY:
+        raise ValueError(f"Timeframe longer than one day is not supported: {freq}")
+    ns = index.to_numpy().astype('datetime64[ns]').view(np.int64)
+
+    if anchor == 'midnight':
+        if DAY.value % freq.value:
+            raise ValueError(f"Timeframe must divide one day: {freq}")
+        return ns - ns % freq.value
+    if anchor != 'session':
+        raise ValueError(f"Unsupported resample anchor: {anchor}")
+
+    # 每天第一根K线的时间作为当天各桶的起点
+    days = ns - ns % DAY.value
+    first = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+    session_open = np.repeat(ns[first], np.diff(np.append(first, len(ns))))
+    return session_open + (ns - session_open) // freq.value * freq.value
+
+
+def resample_ohlcv(data, timeframe, atr_period=None, anchor=None):
+    freq = parse_timeframe(timeframe)
+    keys = bucket_starts(data.index, freq, anchor or CONFIG['resample']['anchor'])
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys)) - 1
+
+    high = np.maximum.reduceat(data['high'].to_numpy(dtype=np.float64), starts)
+    low = np.minimum.reduceat(data['low'].to_numpy(dtype=np.float64), starts)
+    close = data['close'].to_numpy()[ends]
+    atr, _ = calc_seeded_atr(high, low, close, atr_period or CONFIG['resample']['atr_period'])
+
+    return pd.DataFrame({
+        'open': data['open'].to_numpy()[starts],
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': np.add.reduceat(data['volume'].to_numpy(), starts),
+        'atr': np.round(atr, 9),
+    }, index=pd.DatetimeIndex(keys[starts].astype('datetime64[ns]'), name='datetime'))
+
+
+# 聚合结果的文件路径：基础文件名中的时间框架换成目标时间框架
+def resampled_path(base_file, timeframe):
+    parts = os.path.splitext(os.path.basename(base_file))[0].split('_')
+    name = '_'.join(parts[:-1] + [timeframe])
+    return os.path.join(CONFIG['cache_dir'] or 'cache/', 'resampled', f'{name}.csv')
+
+
+# 取（必要时生成）聚合后的数据文件；旁边的 .json 记录基础数据的内容哈希，不一致时重新生成
+def resampled_file(base_file, timeframe):
+    file_path = resampled_path(base_file, timeframe)
+    meta_file = f'{file_path}.json'
+    source_hash = data_hash(base_file)
+
+    if os.path.exists(file_path) and os.path.exists(meta_file):
+        with open(meta_file, encoding='utf-8') as f:
+            if json.load(f).get('source_hash') == source_hash:
+                return file_path
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    data = resample_ohlcv(load_processed(base_file), timeframe)
+    tmp_file = f'{file_path}.{os.getpid()}.tmp'
+    data.to_csv(tmp_file)
+    os.replace(tmp_file, file_path)
+
+    tmp_file = f'{meta_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'source': base_file, 'source_hash': source_hash, 'timeframe': timeframe, 'rows': len(data)}, f,
+                  ensure_ascii=False, indent=2)
+    os.replace(tmp_file, meta_file)
+    return file_path
+
+
+# 按时间框架取数据文件：data_files 中有对应文件时直接使用，否则由基础时间框架聚合
+def resolve_data_file(timeframe, symbol='qqq'):
+    key = f'{symbol}_{timeframe}'
+    if key in CONFIG['data_files']:
+        return CONFIG['data_files'][key]
+
+    base_timeframe = CONFIG['resample']['base_timeframe']
+    base_key = f'{symbol}_{base_timeframe}'
+    if base_key not in CONFIG['data_files']:
+        raise ValueError(f"No data file for {key} and no base data {base_key} to resample from")
+    if parse_timeframe(timeframe) <= parse_timeframe(base_timeframe):
+        raise ValueError(f"Cannot derive {timeframe} from the coarser or equal base timeframe {base_timeframe}")
+    return resampled_file(CONFIG['data_files'][base_key], timeframe)
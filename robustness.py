@@ -0,0 +1,171 @@
+# robustness.py
+# 稳健性分析：对一次回测的逐K线收益与每笔交易收益做大量重抽样，给出年化收益率、最大回撤、夏普比率的置信区间。
+#   bootstrap  逐K线收益有放回抽样
+#   block      移动块自助法：按长度 block_size 的连续片段抽样，保留收益的短期相关性（波动聚集等）
+#   shuffle    打乱交易顺序：每笔交易收益（盈亏 / 开仓前总资产）随机排列后按复利连成资金曲线，
+#              终值与收益分布不变，只有回撤随顺序变化，用来判断最大回撤是否只是交易顺序的偶然
+# 每批重抽样在一个二维数组里一次算完（行 = 一次重抽样），各批分发到进程池；
+# 每批的随机数流由 seed 派生，结果与进程数无关。
+# 夏普比率按逐K线收益年化（与 CustomReturns 相同，无风险利率按 0），shuffle 下按每年交易笔数年化
+
+import os
+import io
+import math
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from metrics import bar_frame, bar_returns, round_trips, years_between
+from main import run_strategy, ensure_dir
+from resample import resolve_data_file
+
+METHODS = ['bootstrap', 'block', 'shuffle']
+METRICS = {'annualized_roi': '年化收益率', 'max_drawdown': '最大回撤', 'sharpe': '夏普比率'}
+
+
+# 每笔交易的收益率：盈亏除以开仓前一根K线的总资产
+def trade_returns(recorder_df, index, initial_cash):
+    trips = round_trips(recorder_df, index)
+    equity = bar_frame(recorder_df, index, initial_cash)['总资产'].to_numpy(dtype=np.float64)
+    before = np.concatenate(([initial_cash], equity))[index.searchsorted(pd.DatetimeIndex(trips['开仓时间']))]
+    return trips['盈亏'].to_numpy(dtype=np.float64) / before
+
+
+# 一批收益序列（每行一条）的指标；log_returns 为 log1p(returns)，就地累加成对数资金曲线（会被覆盖），
+# 回撤在对数资金曲线上算再换回比例；均值与标准差由一阶、二阶和得到，少遍历一遍数组
+def path_metrics(returns, log_returns, num_years, periods_per_year):
+    n = returns.shape[1]
+    total = returns.sum(axis=1)
+    mean = total / n
+    var = np.maximum(np.einsum('ij,ij->i', returns, returns) - total * mean, 0.0) / (n - 1)
+
+    log_equity = np.cumsum(log_returns, axis=1, out=log_returns)
+    final = log_equity[:, -1].copy()
+    peak = np.maximum.accumulate(log_equity, axis=1)
+    log_drawdown = np.subtract(peak, log_equity, out=peak).max(axis=1)
+
+    std = np.sqrt(var)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, mean / std * math.sqrt(periods_per_year), 0.0)
+    return {
+        'annualized_roi': np.expm1(final / num_years),
+        'max_drawdown': -np.expm1(-log_drawdown),
+        'sharpe': sharpe,
+    }
+
+
+# 重抽样的行号：bootstrap 逐个抽，block 抽块起点后展开成连续片段，shuffle 为随机排列
+def resample_indices(rng, method, count, n, block_size):
+    if method == 'bootstrap':
+        return rng.integers(0, n, size=(count, n))
+    if method == 'block':
+        blocks = -(-n // block_size)
+        starts = rng.integers(0, n - block_size + 1, size=(count, blocks))
+        return (starts[:, :, None] + np.arange(block_size)).reshape(count, -1)[:, :n]
+    if method == 'shuffle':
+        return rng.permuted(np.broadcast_to(np.arange(n), (count, n)), axis=1)
+    raise ValueError(f"Unsupported resample method: {method}")
+
+
+# 一批重抽样，可在子进程中运行
+def run_batch(task):
+    method, seed, count, returns, num_years, periods_per_year, block_size = task
+    rng = np.random.default_rng(seed)
+    indices = resample_indices(rng, method, count, len(returns), block_size)
+    return path_metrics(returns[indices], np.log1p(returns)[indices], num_years, periods_per_year)
+
+
+def summarize(method, point, samples, confidence):
+    lower, upper = (1 - confidence) / 2, 1 - (1 - confidence) / 2
+    rows = []
+    for key, label in METRICS.items():
+        values = samples[key]
+        rows.append({
+            '方法': method,
+            '指标': label,
+            '原始值': float(point[key][0]),
+            '均值': float(values.mean()),
+            '标准差': float(values.std()),
+            f'{lower:.1%}分位': float(np.quantile(values, lower)),
+            '中位数': float(np.median(values)),
+            f'{upper:.1%}分位': float(np.quantile(values, upper)),
+        })
+    return rows
+
+
+# 对逐K线记录做稳健性分析，返回 (汇总表, {方法: {指标: 全部重抽样结果}})
+def analyze_robustness(recorder_df, index, initial_cash, methods=None, resamples=None, block_size=None,
+                       confidence=None, batch_size=None, seed=None, workers=None):
+    settings = CONFIG['robustness']
+    methods = methods or settings['methods']
+    resamples = resamples or settings['resamples']
+    confidence = confidence or settings['confidence']
+    batch_size = batch_size or settings['batch_size']
+    seed = settings['seed'] if seed is None else seed
+    if workers is None:
+        workers = CONFIG['workers']
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    num_years = years_between(index)
+    equity = bar_frame(recorder_df, index, initial_cash)['总资产'].to_numpy(dtype=np.float64)
+    series = {'bar': bar_returns(equity, initial_cash), 'trade': trade_returns(recorder_df, index, initial_cash)}
+    block_size = block_size or settings['block_size'] or max(1, int(round(len(series['bar']) ** (1 / 3))))
+
+    tasks, inputs = [], {}
+    for method, method_seed in zip(methods, np.random.SeedSequence(seed).spawn(len(methods))):
+        returns = series['trade' if method == 'shuffle' else 'bar']
+        if len(returns) < 2:
+            continue
+        periods_per_year = len(returns) / num_years
+        inputs[method] = (returns, periods_per_year)
+        counts = [min(batch_size, resamples - i) for i in range(0, resamples, batch_size)]
+        for count, batch_seed in zip(counts, method_seed.spawn(len(counts))):
+            tasks.append((method, batch_seed, count, returns, num_years, periods_per_year,
+                          min(block_size, len(returns))))
+
+    if workers == 1 or len(tasks) <= 1:
+        outputs = [run_batch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            outputs = list(executor.map(run_batch, tasks))
+
+    rows, samples = [], {}
+    for method, (returns, periods_per_year) in inputs.items():
+        parts = [output for task, output in zip(tasks, outputs) if task[0] == method]
+        samples[method] = {key: np.concatenate([part[key] for part in parts]) for key in METRICS}
+        point = path_metrics(returns[None, :], np.log1p(returns)[None, :], num_years, periods_per_year)
+        rows += summarize(method, point, samples[method], confidence)
+    return pd.DataFrame(rows), samples
+
+
+def main():
+    settings = CONFIG['robustness']
+    parser = argparse.ArgumentParser(description='重抽样稳健性分析')
+    parser.add_argument('--strategy', default=settings['strategy'])
+    parser.add_argument('--timeframe', default=settings['timeframe'])
+    parser.add_argument('--methods', nargs='*', choices=METHODS, default=settings['methods'])
+    parser.add_argument('--resamples', type=int, default=settings['resamples'])
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    data_file = resolve_data_file(args.timeframe)
+    strategy_params = (CONFIG['strategies'][args.strategy]['params'] or {}).get(args.timeframe, {})
+    with contextlib.redirect_stdout(io.StringIO()):
+        cerebro, results, num_years = run_strategy(data_file, args.strategy, strategy_params,
+                                                   timeframe=args.timeframe)
+    strategy = results[0]
+    table, _ = analyze_robustness(strategy.trade_recorder.get_analysis(), strategy.datas[0].p.dataname.index,
+                                  CONFIG['initial_cash'], args.methods, args.resamples, workers=args.workers)
+
+    print(table.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+    output_file = f"{CONFIG['output_dir']}robustness_{args.strategy}_{args.timeframe}.csv"
+    ensure_dir(output_file)
+    table.to_csv(output_file, index=False, encoding='utf-8-sig')
+    print(f"\n稳健性分析结果已保存到: {output_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,176 @@
 # strategy.py
 
+import math
 import backtrader as bt
 from config import CONFIG
 import pandas as pd
+import numpy as np
+from indicators import calc_vwma, calc_std, RunningStd, indicator_column
 
 # 计算VWMA
+# next() 维护滑动窗口内的成交量与价格×成交量的累计和，每根K线 O(1)；
+# runonce 模式下 once() 用 NumPy 分段累计和一次性算出整列（indicators.calc_vwma）
 class VolumeWeightedMovingAverage(bt.Indicator):
     lines = ('vwma',)
     params = (('period', 14),) 
+    RESYNC_BARS = 4096
 
     def __init__(self):
         self.addminperiod(self.params.period)
+        self.total_volume = 0.0
+        self.total_price_volume = 0.0
+
+    def update_window(self):
+        period = self.params.period
+        # 每隔 RESYNC_BARS 根K线按窗口重新求和，消除加减累积的舍入误差，均摊仍为 O(1)
+        if len(self) >= period and len(self) % self.RESYNC_BARS == 0:
+            self.total_volume = math.fsum(self.data.volume.get(size=period))
+            self.total_price_volume = math.fsum(
+                c * v for c, v in zip(self.data.close.get(size=period), self.data.volume.get(size=period)))
+            return
+
+        volume = self.data.volume[0]
+        self.total_volume += volume
+        self.total_price_volume += self.data.close[0] * volume
+
+        # 移出窗口最前面的一根K线
+        if len(self) > period:
+            old_volume = self.data.volume[-period]
+            self.total_volume -= old_volume
+            self.total_price_volume -= self.data.close[-period] * old_volume
+
+    def prenext(self):
+        self.update_window()
 
     def next(self):
-        total_volume = 0
-        total_price_volume = 0
+        self.update_window()
+        self.lines.vwma[0] = self.total_price_volume / self.total_volume
+
+    def once(self, start, end):
+        close = np.frombuffer(self.data.close.array, dtype=np.float64)[:end]
+        volume = np.frombuffer(self.data.volume.array, dtype=np.float64)[:end]
+        vwma = np.frombuffer(self.lines.vwma.array, dtype=np.float64)
+
+        vwma[start:end] = calc_vwma(close, volume, self.params.period)[start:end]
+
+
+
+# 增量标准差，每根K线 O(1) 更新，支持 expanding / rolling / ewm 三种模式
+# period 在 rolling 下为窗口长度、ewm 下为 span、expanding 下为最少样本数；
+# runonce 模式下 once() 用 indicators.calc_std 整列向量化计算
+class OnlineStandardDeviation(bt.Indicator):
+    lines = ('std',)
+    RESYNC_BARS = 4096
+    params = (
+        ('mode', 'expanding'),
+        ('period', None),
+    )
+
+    def __init__(self):
+        self.addminperiod(max(self.params.period or 2, 2))
+        self.running = RunningStd(self.params.mode, self.params.period)
+
+    def update_std(self):
+        old_value = None
+        if self.params.mode == 'rolling' and len(self) > self.params.period:
+            # 每隔 RESYNC_BARS 根K线按窗口重新计算，与 VWMA 相同
+            if len(self) % self.RESYNC_BARS == 0:
+                return self.running.reset(list(self.data.get(size=self.params.period)))
+            old_value = self.data[-self.params.period]
+        return self.running.update(self.data[0], old_value)
+
+    def prenext(self):
+        self.update_std()
+
+    def next(self):
+        self.lines.std[0] = self.update_std()
+
+    def once(self, start, end):
+        close = np.frombuffer(self.data.array, dtype=np.float64)[:end]
+        std = np.frombuffer(self.lines.std.array, dtype=np.float64)
+
+        std[start:end] = calc_std(close, self.params.mode, self.params.period)[start:end]
+
+
+
+# 读取数据源中预计算好的指标列，最小周期与对应的指标保持一致
+class PrecomputedLine(bt.Indicator):
+    lines = ('value',)
+    params = (('minperiod', 1),)
+
+    def __init__(self):
+        self.addminperiod(self.params.minperiod)
+
+    def next(self):
+        self.lines.value[0] = self.data[0]
+
+    def once(self, start, end):
+        src = np.frombuffer(self.data.array, dtype=np.float64)
+        dst = np.frombuffer(self.lines.value.array, dtype=np.float64)
+        dst[start:end] = src[start:end]
 
-        for i in range(-self.params.period + 1, 1):
-            total_volume += self.data.volume[i]
-            total_price_volume += self.data.close[i] * self.data.volume[i]
 
-        self.lines.vwma[0] = total_price_volume / total_volume
+# 创建指标：数据源带有对应的预计算列时直接读取，否则在回测中计算
+def precomputed_line(data, spec, minperiod):
+    line = getattr(data.lines, indicator_column(spec), None)
+    return PrecomputedLine(line, minperiod=minperiod) if line is not None else None
+
+
+def vwma_indicator(data, period):
+    line = precomputed_line(data, ('vwma', period), period)
+    return line if line is not None else VolumeWeightedMovingAverage(data, period=period)
+
+
+def atr_indicator(data, period):
+    line = precomputed_line(data, ('atr', period), period + 1)
+    return line if line is not None else bt.indicators.ATR(data, period=period)
+
+
+def std_indicator(data, mode, period):
+    line = precomputed_line(data, ('std', mode, period), max(period or 2, 2))
+    return line if line is not None else OnlineStandardDeviation(data.close, mode=mode, period=period)
 
 
 
 # 记录交易过程中的数据
+# 按列存放在预分配的 NumPy 数组中：容量按数据源长度预估，不足时翻倍扩容；
+# 交易状态以 int8 编码存储，输出时转为分类列。
+# Cerebro 设置了 trade_writer 时改为固定大小的缓冲，写满即交给 writer 落盘后清空
 class TradeRecorder:
+    trade_states = ['无', '买', '加', '卖']
+    value_columns = ['open', 'high', 'low', 'close', '交易价格', '交易数量', '交易金额', '交易费用',
+                     '当前持仓', '可用资金', '资金利用率', '资产价值', '未实现盈亏', '总资产', '净值']
+    columns = ['时间'] + value_columns[:4] + ['交易状态'] + value_columns[4:]
+    # 数量列：全部按整数记录时（按整数下单的 VADStrategy、buyandhold）输出为整数列；分块写出时始终为 float64
+    size_columns = ('交易数量', '当前持仓')
+
+    # backtrader 的时间是自公元1年起的浮点天数，719163 对应 1970-01-01
+    epoch_ordinal = 719163
+    ms_per_day = 86400 * 1000
+
     def __init__(self, strategy):
         self.strategy = strategy
-        self.data = []
         self.current_trade = None
+        self.size = 0
+        self.fractional = {column: False for column in self.size_columns}
+        self.writer = getattr(strategy.env, 'trade_writer', None)
+
+        # 每根K线记录一行，成交时再多记录一行
+        if self.writer is not None:
+            capacity = self.writer.chunk_size
+        else:
+            capacity = max(strategy.data.buflen(), 1) + 64
+        self.datetimes = np.empty(capacity, dtype=np.float64)
+        self.states = np.empty(capacity, dtype=np.int8)
+        self.values = np.empty((len(self.value_columns), capacity), dtype=np.float64)
+
+    def grow(self):
+        capacity = 2 * len(self.datetimes)
+        self.datetimes = np.resize(self.datetimes, capacity)
+        self.states = np.resize(self.states, capacity)
+        values = np.empty((len(self.value_columns), capacity), dtype=np.float64)
+        values[:, :self.size] = self.values[:, :self.size]
+        self.values = values
 
     def record(self, order=None): 
         current_cash = self.strategy.broker.getcash()
@@ -43,42 +184,77 @@ class TradeRecorder:
 
         if order and order.status == order.Completed:
             if order.isbuy():
-                buy_sell = '买' if self.strategy.position.size == order.size else '加'
+                buy_sell = 1 if self.strategy.position.size == order.size else 2
             elif order.issell():
-                buy_sell = '卖'
+                buy_sell = 3
             trade_price = order.executed.price
             trade_size = order.executed.size
             trade_value = trade_price * trade_size
             trade_cost = trade_value * CONFIG['friction_cost']
         else:
-            buy_sell = '无'
+            buy_sell = 0
             trade_price = current_price
             trade_size = trade_value = trade_cost = 0
 
         unrealized_pnl = asset_value - (current_position * self.strategy.position.price) if current_position > 0 else 0
+        if isinstance(trade_size, float):
+            self.fractional['交易数量'] = True
+        if isinstance(current_position, float):
+            self.fractional['当前持仓'] = True
+
+        if self.size == len(self.datetimes):
+            if self.writer is not None:
+                self.flush()
+            else:
+                self.grow()
+
+        i = self.size
+        self.datetimes[i] = self.strategy.data.datetime[0]
+        self.states[i] = buy_sell
+        self.values[:, i] = (
+            self.strategy.data.open[0],
+            self.strategy.data.high[0],
+            self.strategy.data.low[0],
+            self.strategy.data.close[0],
+            trade_price,
+            trade_size,
+            trade_value,
+            trade_cost,
+            current_position,
+            current_cash,
+            capital_utilization_rate,
+            asset_value,
+            unrealized_pnl,
+            total_assets,
+            round(net_value, 4)
+        )
+        self.size += 1
 
-        self.data.append({
-            '时间': self.strategy.data.datetime.datetime(),
-            'open': self.strategy.data.open[0],
-            'high': self.strategy.data.high[0],
-            'low': self.strategy.data.low[0],
-            'close': self.strategy.data.close[0],
-            '交易状态': buy_sell,
-            '交易价格': trade_price,
-            '交易数量': trade_size,
-            '交易金额': trade_value,
-            '交易费用': trade_cost,
-            '当前持仓': current_position,
-            '可用资金': current_cash,
-            '资金利用率':capital_utilization_rate,
-            '资产价值':asset_value,
-            '未实现盈亏': unrealized_pnl,
-            '总资产': total_assets,
-            '净值': round(net_value, 4)
-        })
-            
     def get_analysis(self):
-        return pd.DataFrame(self.data)
+        n = self.size
+        # 浮点天数的精度约为10微秒，按毫秒取整
+        ms = np.rint((self.datetimes[:n] - self.epoch_ordinal) * self.ms_per_day).astype(np.int64)
+
+        data = {'时间': (ms * 1000).astype('datetime64[us]')}
+        for j, column in enumerate(self.value_columns):
+            data[column] = self.values[j, :n]
+        # 分块写出时各块的列类型须相同，数量列保持 float64（后面的块可能出现小数数量）
+        for column in self.size_columns:
+            if self.writer is None and not self.fractional[column]:
+                data[column] = data[column].astype(np.int64)
+        data['交易状态'] = pd.Categorical.from_codes(self.states[:n], categories=self.trade_states)
+
+        return pd.DataFrame(data, columns=self.columns, copy=False)
+
+    # 把缓冲中的记录交给 writer 写出，之后缓冲可被覆盖
+    def flush(self):
+        if self.size:
+            self.writer.write(self.get_analysis())
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
 
     def record_trade(self):
         # 仅在有交易发生时调用
@@ -117,6 +293,11 @@ class VADStrategy(bt.Strategy):
         ('atr_period', None),
     )
 
+    # 策略用到的指标，供回测前预计算
+    @staticmethod
+    def indicator_specs(params):
+        return [('vwma', params['vwma_period']), ('atr', params['atr_period'])]
+
     def __init__(self):
         if self.p.timeframe not in CONFIG['strategies']['vad']['enabled_timeframes']:
             raise ValueError(f"Unsupported timeframe: {self.p.timeframe}")
@@ -129,8 +310,8 @@ class VADStrategy(bt.Strategy):
         self.vwma_period = self.p.vwma_period
         self.atr_period = self.p.atr_period
 
-        self.vwma = VolumeWeightedMovingAverage(self.data, period=self.vwma_period)
-        self.atr = bt.indicators.ATR(self.data, period=self.atr_period)
+        self.vwma = vwma_indicator(self.data, self.vwma_period)
+        self.atr = atr_indicator(self.data, self.atr_period)
 
         self.addition_count = 0
         self.takeprofit = False
@@ -234,6 +415,11 @@ class VADStrategy(bt.Strategy):
 class BuyAndHoldStrategy(bt.Strategy):
     params = (('timeframe', None),)
 
+    # 策略用到的指标，供回测前预计算
+    @staticmethod
+    def indicator_specs(params):
+        return []
+
     def __init__(self):
         if self.p.timeframe not in CONFIG['strategies']['buyandhold']['enabled_timeframes']:
             raise ValueError(f"不支持的timeframe: {self.p.timeframe}")
@@ -301,6 +487,11 @@ class SupertrendATR(bt.Strategy):
         ('k', None)
     )
 
+    # 策略用到的指标，供回测前预计算
+    @staticmethod
+    def indicator_specs(params):
+        return [('vwma', params['vwma_period']), ('atr', params['atr_period'])]
+
     def __init__(self):
         if self.p.timeframe not in CONFIG['strategies']['SupertrendATR']['enabled_timeframes']:
             raise ValueError(f"不支持的timeframe: {self.p.timeframe}")
@@ -311,10 +502,10 @@ class SupertrendATR(bt.Strategy):
         self.trade_recorder = TradeRecorder(self)
 
         self.vwma_period = self.p.vwma_period
-        self.vwma = VolumeWeightedMovingAverage(self.data, period=self.vwma_period)
+        self.vwma = vwma_indicator(self.data, self.vwma_period)
 
         self.atr_period = self.p.atr_period
-        self.atr = bt.indicators.ATR(self.data, period=self.atr_period)
+        self.atr = atr_indicator(self.data, self.atr_period)
 
     def next(self):
         long_signal = self.data.close < self.vwma - self.p.k * self.atr
@@ -369,15 +560,22 @@ class SupertrendATR(bt.Strategy):
 class SupertrendSd(bt.Strategy):
     params = (
         ('timeframe', None),
-        ('k', None)
+        ('k', None),
+        ('std_mode', 'expanding'),
+        ('std_period', None),
     )
 
+    # 策略用到的指标，供回测前预计算
+    @staticmethod
+    def indicator_specs(params):
+        return [('std', params.get('std_mode', 'expanding'), params.get('std_period'))]
+
     def __init__(self):
         if self.p.timeframe not in CONFIG['strategies']['SupertrendSd']['enabled_timeframes']:
             raise ValueError(f"不支持的timeframe: {self.p.timeframe}")
 
         self.k = self.p.k
-        self.std = bt.indicators.StandardDeviation(self.data.close, period=len(self.data))
+        self.std = std_indicator(self.data, self.p.std_mode, self.p.std_period)
         self.close = self.datas[0].close
         self.order = None
         self.trade_recorder = TradeRecorder(self)
@@ -390,10 +588,6 @@ class SupertrendSd(bt.Strategy):
         self.buy_signal_flag = False
         self.sell_signal_flag = False
 
-        # 如果数据不足，不进行操作
-        if len(self) <= self.std.period:
-            return
-    
         # 检查是否有待处理的订单
         if self.order:
             return
@@ -439,24 +633,34 @@ class SupertrendMf(bt.Strategy):
         ('k', None),
         ('vwma_period', None),
         ('atr_period', None),
+        ('std_mode', 'expanding'),
+        ('std_period', None),
     )
 
+    # 策略用到的指标，供回测前预计算
+    @staticmethod
+    def indicator_specs(params):
+        return [
+            ('vwma', params['vwma_period']),
+            ('atr', params['atr_period']),
+            ('std', params.get('std_mode', 'expanding'), params.get('std_period')),
+        ]
+
     def __init__(self):
         if self.p.timeframe not in CONFIG['strategies']['SupertrendMf']['enabled_timeframes']:
             raise ValueError(f"不支持的timeframe: {self.p.timeframe}")
 
         self.k = self.p.k
-        self.p = self.p.p
-        self.std = bt.indicators.StandardDeviation(self.data.close, period=len(self.data))
+        self.std = std_indicator(self.data, self.p.std_mode, self.p.std_period)
         self.close = self.datas[0].close
         self.order = None
         self.trade_recorder = TradeRecorder(self)
 
         self.vwma_period = self.p.vwma_period
-        self.vwma = VolumeWeightedMovingAverage(self.data, period=self.vwma_period)
+        self.vwma = vwma_indicator(self.data, self.vwma_period)
 
         self.atr_period = self.p.atr_period
-        self.atr = bt.indicators.ATR(self.data, period=self.atr_period)
+        self.atr = atr_indicator(self.data, self.atr_period)
 
     def next(self):
         ATR_long_signal = self.data.close < self.vwma - self.p.p * self.atr
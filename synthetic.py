@@ -0,0 +1,163 @@
+# synthetic.py
+# 合成行情数据，用于大规模基准测试与扩展性测试：
+#   gbm     几何布朗运动，固定年化漂移与波动率
+#   regime  状态切换：在若干 (漂移, 波动率, 成交量倍数) 状态之间按几何分布的持续时长切换
+# 输出与 processed/ 下的数据格式完全一致（datetime,open,high,low,close,volume,atr），
+# 按块生成并追加写出，内存占用与总长度无关。收益、影线、成交量、状态各用独立的随机数流，
+# 同一 seed 下结果与分块大小无关
+
+import os
+import math
+import argparse
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from indicators import calc_seeded_atr
+
+
+def timeframe_minutes(timeframe):
+    if not timeframe.endswith('min'):
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+    return int(timeframe[:-len('min')])
+
+
+# 每个交易日的K线数：session 时段按 timeframe 等分，每天至少一根
+def bars_per_day(minutes, settings):
+    session_start, session_end = (pd.Timedelta(f'{t}:00') for t in settings['session'])
+    return max(1, math.ceil((session_end - session_start).total_seconds() / 60 / minutes))
+
+
+# 第 first_bar 根起 n 根K线的时间：依次排在各工作日的 session 时段内
+def bar_times(first_bar, n, minutes, settings):
+    per_day = bars_per_day(minutes, settings)
+    session_start = pd.Timedelta(f"{settings['session'][0]}:00")
+
+    bar = np.arange(first_bar, first_bar + n)
+    days = np.busday_offset(np.datetime64(settings['start'], 'D'), bar // per_day, roll='forward')
+    offsets = session_start + pd.to_timedelta((bar % per_day) * minutes, unit='min')
+    return pd.DatetimeIndex(days.astype('datetime64[ns]') + offsets.to_numpy(), name='datetime')
+
+
+# 逐块生成数据，返回 DataFrame 迭代器；跨块的价格、状态与 ATR 递推状态在块之间延续
+def generate(bars, model=None, seed=None, timeframe='5min', chunk_size=None, settings=None):
+    settings = {**CONFIG['synthetic'], **(settings or {})}
+    model = model or settings['model']
+    chunk_size = chunk_size or settings['chunk_size']
+    minutes = timeframe_minutes(timeframe)
+    per_year = 252 * bars_per_day(minutes, settings)
+
+    if model == 'gbm':
+        regimes = [{'drift': settings['drift'], 'volatility': settings['volatility'], 'volume': 1.0}]
+    elif model == 'regime':
+        regimes = settings['regimes']
+    else:
+        raise ValueError(f"Unsupported synthetic model: {model}")
+
+    drift = np.array([regime['drift'] for regime in regimes]) / per_year
+    volatility = np.array([regime['volatility'] for regime in regimes]) / math.sqrt(per_year)
+    volume_scale = np.array([regime['volume'] for regime in regimes]) * settings['volume']
+
+    return_rng, range_rng, volume_rng, regime_rng = (
+        np.random.default_rng(stream) for stream in np.random.SeedSequence(seed).spawn(4))
+
+    log_price = math.log(settings['price'])
+    regime = int(regime_rng.integers(len(regimes)))
+    remaining = int(regime_rng.geometric(1.0 / settings['mean_regime_bars']))
+    period = settings['atr_period']
+    prev_close = None
+    atr = None
+
+    for first_bar in range(0, bars, chunk_size):
+        n = min(chunk_size, bars - first_bar)
+
+        # 状态序列：当前状态持续 remaining 根后切换到其他状态之一
+        labels = np.empty(n, dtype=np.int64)
+        filled = 0
+        while filled < n:
+            if remaining == 0:
+                regime = (regime + int(regime_rng.integers(1, len(regimes)))) % len(regimes) \
+                    if len(regimes) > 1 else regime
+                remaining = int(regime_rng.geometric(1.0 / settings['mean_regime_bars']))
+            take = min(remaining, n - filled)
+            labels[filled:filled + take] = regime
+            filled += take
+            remaining -= take
+
+        sigma = volatility[labels]
+        shocks = return_rng.standard_normal(n)
+        log_returns = drift[labels] - 0.5 * sigma ** 2 + sigma * shocks
+        # 从上一块的对数价格起逐项累加，与整段一次生成的结果逐位一致
+        log_close = np.cumsum(np.concatenate(([log_price], log_returns)))
+        log_price = log_close[-1]
+        prices = np.exp(log_close)
+        open_, close = prices[:-1], prices[1:]
+
+        # 影线长度与当根波动率成比例
+        wicks = 0.5 * sigma[:, None] * np.abs(range_rng.standard_normal((n, 2)))
+        high = np.maximum(open_, close) * np.exp(wicks[:, 0])
+        low = np.minimum(open_, close) * np.exp(-wicks[:, 1])
+        # 成交量随状态与当根涨跌幅放大
+        volume = volume_scale[labels] * volume_rng.lognormal(0.0, 0.5, n) * (1.0 + np.abs(shocks))
+
+        # 价格保留两位小数；四舍五入单调，不会破坏 high/low 与 open/close 的大小关系
+        open_, high, low, close = (np.round(values, 2) for values in (open_, high, low, close))
+
+        atr_values, atr = calc_seeded_atr(high, low, close, period, prev_close, atr)
+        prev_close = close[-1]
+
+        yield pd.DataFrame({
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': np.maximum(volume.round(), 1).astype(np.int64),
+            'atr': np.round(atr_values, 9),
+        }, index=bar_times(first_bar, n, minutes, settings))
+
+
+# 流式写出 CSV：先写临时文件，完成后替换，避免中断时留下不完整的数据文件
+def write_synthetic(file_path, bars, model=None, seed=None, timeframe='5min', chunk_size=None, settings=None):
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_file = f'{file_path}.{os.getpid()}.tmp'
+    first = True
+    for chunk in generate(bars, model, seed, timeframe, chunk_size, settings):
+        chunk.to_csv(tmp_file, mode='w' if first else 'a', header=first)
+        first = False
+    os.replace(tmp_file, file_path)
+    return file_path
+
+
+# 缓存的合成数据文件：cache_dir/synthetic/ 下按 模型、长度、seed 命名，
+# 文件名以时间框架结尾，main.run_strategy 可据此取策略参数
+def synthetic_file(bars, seed=0, model=None, timeframe='5min'):
+    model = model or CONFIG['synthetic']['model']
+    directory = os.path.join(CONFIG['cache_dir'] or 'cache/', 'synthetic')
+    file_path = os.path.join(directory, f'synthetic_{model}_{bars}_{seed}_{timeframe}.csv')
+    if not os.path.exists(file_path):
+        write_synthetic(file_path, bars, model, seed, timeframe)
+    return file_path
+
+
+def main():
+    settings = CONFIG['synthetic']
+    parser = argparse.ArgumentParser(description='生成合成行情数据')
+    parser.add_argument('bars', type=int, help='K线数')
+    parser.add_argument('--model', choices=['gbm', 'regime'], default=settings['model'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeframe', default='5min')
+    parser.add_argument('--chunk-size', type=int, default=settings['chunk_size'])
+    parser.add_argument('--output', default=None, help='输出 CSV 路径，默认写入缓存目录')
+    args = parser.parse_args()
+
+    if args.output:
+        file_path = write_synthetic(args.output, args.bars, args.model, args.seed, args.timeframe, args.chunk_size)
+    else:
+        file_path = synthetic_file(args.bars, args.seed, args.model, args.timeframe)
+    print(f"合成数据已保存到: {file_path}")
+
+
+if __name__ == '__main__':
+    main()
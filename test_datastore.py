@@ -0,0 +1,87 @@
+# test_datastore.py
+# 列式缓存的追加路径：源 CSV 末尾追加K线后，只解析新增行、续算指标列，结果与对完整文件重新构建缓存逐位相同
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import datastore
+from config import CONFIG
+
+DATA_FILE = 'processed/BATS_QQQ_5min.csv'
+SPECS = [('vwma', 14), ('atr', 14), ('std', 'expanding', None), ('std', 'rolling', 20), ('std', 'ewm', 20)]
+
+
+@pytest.fixture
+def lines():
+    with open(DATA_FILE, 'rb') as f:
+        return f.read().splitlines(keepends=True)
+
+
+def load(tmp_path, monkeypatch, name, content):
+    monkeypatch.setitem(CONFIG, 'cache_dir', str(tmp_path / name))
+    file_path = tmp_path / f'{name}.csv'
+    file_path.write_bytes(content)
+    return datastore.load_indicators(str(file_path), SPECS)
+
+
+def test_append_matches_rebuild(tmp_path, monkeypatch, lines):
+    expected = load(tmp_path, monkeypatch, 'full', b''.join(lines))
+
+    cut = len(lines) - 1500
+    file_path = str(tmp_path / 'part.csv')
+    load(tmp_path, monkeypatch, 'part', b''.join(lines[:cut]))
+    for chunk in (lines[cut:cut + 1], lines[cut + 1:cut + 700], lines[cut + 700:]):
+        with open(file_path, 'ab') as f:
+            f.write(b''.join(chunk))
+        actual = datastore.load_indicators(file_path, SPECS)
+
+    meta = datastore.read_meta(datastore.cache_path(file_path))
+    assert [entry['rows'] for entry in meta['lineage']] == [cut - 1, cut, cut + 699]
+    # 内容哈希始终是当前文件（及追加前各版本）的真实哈希，与缓存的构建方式无关
+    assert meta['hash'] == datastore.file_hash(str(tmp_path / 'full.csv'))
+    prefix_path = tmp_path / 'prefix.csv'
+    prefix_path.write_bytes(b''.join(lines[:cut + 1]))
+    assert meta['lineage'][1]['hash'] == datastore.file_hash(str(prefix_path))
+    assert actual.index.equals(expected.index)
+    for column in expected.columns:
+        assert actual[column].dtype == expected[column].dtype
+        if column == 'std_ewm_20':
+            # ewm 续算用 RunningStd 递推，整列计算用 pandas，只差舍入误差
+            np.testing.assert_allclose(actual[column], expected[column], rtol=1e-11, atol=0)
+        else:
+            np.testing.assert_array_equal(actual[column], expected[column])
+
+
+# 原有部分被修改后再追加：不是单纯追加，应重新构建。修改处在文件开头（长度不变）或原文件最后一行
+@pytest.mark.parametrize('position', [5, -11])
+def test_modified_prefix_rebuilds(tmp_path, monkeypatch, lines, position):
+    load(tmp_path, monkeypatch, 'part', b''.join(lines[:-10]))
+    file_path = str(tmp_path / 'part.csv')
+    lines = list(lines)
+    line = lines[position]
+    lines[position] = line[:-2] + (b'1' if line[-2:-1] != b'1' else b'2') + line[-1:]
+    with open(file_path, 'wb') as f:
+        f.write(b''.join(lines))
+    actual = datastore.load_indicators(file_path, SPECS)
+
+    meta = datastore.read_meta(datastore.cache_path(file_path))
+    assert meta['lineage'] == []
+    assert meta['rows'] == len(lines) - 1
+    assert meta['hash'] == datastore.file_hash(file_path)
+    np.testing.assert_array_equal(actual['atr'], pd.read_csv(file_path)['atr'])
+
+
+# 追加后只改修改时间（touch、重新复制）：内容哈希相同，缓存继续有效，不重新构建
+def test_touch_after_append_keeps_cache(tmp_path, monkeypatch, lines):
+    load(tmp_path, monkeypatch, 'part', b''.join(lines[:-10]))
+    file_path = str(tmp_path / 'part.csv')
+    with open(file_path, 'ab') as f:
+        f.write(b''.join(lines[-10:]))
+    datastore.load_indicators(file_path, SPECS)
+    os.utime(file_path, ns=(0, 0))
+    datastore.load_indicators(file_path, SPECS)
+
+    meta = datastore.read_meta(datastore.cache_path(file_path))
+    assert meta['mtime_ns'] == 0
+    assert [entry['rows'] for entry in meta['lineage']] == [len(lines) - 11]
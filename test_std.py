@@ -0,0 +1,43 @@
+# test_std.py
+# 标准差对照测试：向量化的 calc_std（once() 与预计算使用）vs 逐根K线调用 RunningStd（next() 使用），
+# 以及 rolling 模式与逐窗口两遍法的比较
+
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+from main import load_data
+from indicators import calc_std, RunningStd
+
+MODES = [('expanding', None), ('expanding', 20), ('rolling', 20), ('rolling', 200), ('ewm', 20)]
+
+
+def running_std(close, mode, period):
+    running = RunningStd(mode, period)
+    values = close.tolist()
+    return np.array([running.update(value, values[i - period] if mode == 'rolling' and i >= period else None)
+                     for i, value in enumerate(values)])
+
+
+@pytest.fixture(scope='module')
+def close():
+    return load_data('processed/BATS_QQQ_5min.csv')['close'].to_numpy(dtype=np.float64)
+
+
+@pytest.mark.parametrize('mode, period', MODES)
+def test_matches_running_std(close, mode, period):
+    expected = running_std(close, mode, period)
+    # 滑动 Welford 更新本身有累积误差，rolling 的容差放宽
+    rtol = 1e-7 if mode == 'rolling' else 1e-11
+    np.testing.assert_allclose(calc_std(close, mode, period), expected, rtol=rtol, atol=1e-12)
+
+
+@pytest.mark.parametrize('period', [20, 200])
+def test_rolling_matches_two_pass(close, period):
+    expected = sliding_window_view(close, period).std(axis=1)
+    np.testing.assert_allclose(calc_std(close, 'rolling', period)[period - 1:], expected, rtol=1e-10, atol=0)
+
+
+@pytest.mark.parametrize('mode, period', MODES)
+def test_short_series(mode, period):
+    close = np.array([1.0, 2.0, 4.0])
+    np.testing.assert_allclose(calc_std(close, mode, period), running_std(close, mode, period), rtol=1e-12, atol=0)
@@ -0,0 +1,98 @@
+# test_vwma.py
+# VWMA 对照测试：原逐根循环求和的实现 vs 累计和 next() / 分段累计和 once()，
+# 在 processed/ 数据上分别以 runonce 与逐根 next 模式运行；另用长序列检查累计和的误差不随长度累积
+
+import numpy as np
+import pandas as pd
+import backtrader as bt
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+from main import load_data
+from synthetic import generate
+from strategy import VolumeWeightedMovingAverage
+from indicators import calc_vwma
+
+PERIOD = 14
+RTOL = 1e-12
+
+
+# 原实现：每根K线对窗口内的K线逐个求和
+class LoopVolumeWeightedMovingAverage(bt.Indicator):
+    lines = ('vwma',)
+    params = (('period', 14),)
+
+    def __init__(self):
+        self.addminperiod(self.params.period)
+
+    def next(self):
+        total_volume = 0
+        total_price_volume = 0
+
+        for i in range(-self.params.period + 1, 1):
+            total_volume += self.data.volume[i]
+            total_price_volume += self.data.close[i] * self.data.volume[i]
+
+        self.lines.vwma[0] = total_price_volume / total_volume
+
+
+class VwmaStrategy(bt.Strategy):
+    params = (('loop', True),)
+
+    def __init__(self):
+        self.vwma = VolumeWeightedMovingAverage(self.data, period=PERIOD)
+        if self.p.loop:
+            self.loop_vwma = LoopVolumeWeightedMovingAverage(self.data, period=PERIOD)
+
+
+def run_vwma(data, runonce, loop=True):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=data))
+    cerebro.addstrategy(VwmaStrategy, loop=loop)
+    return cerebro.run(runonce=runonce)[0]
+
+
+# 逐窗口直接求和的参考值
+def exact_vwma(close, volume, period):
+    result = np.full(len(close), np.nan)
+    result[period - 1:] = (sliding_window_view(close * volume, period).sum(axis=1)
+                           / sliding_window_view(volume, period).sum(axis=1))
+    return result
+
+
+def assert_same(actual, expected):
+    actual = np.asarray(actual, dtype=np.float64)
+    expected = np.asarray(expected, dtype=np.float64)
+    assert actual.shape == expected.shape
+    assert np.array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_allclose(actual, expected, rtol=RTOL, atol=0)
+
+
+@pytest.mark.parametrize('runonce', [True, False])
+@pytest.mark.parametrize('data_file', ['processed/BATS_QQQ_5min.csv', 'processed/BATS_QQQ_240min.csv'])
+def test_matches_loop_implementation(data_file, runonce):
+    strategy = run_vwma(load_data(data_file), runonce)
+    assert_same(strategy.vwma.lines.vwma.array, strategy.loop_vwma.lines.vwma.array)
+
+
+def test_calc_vwma_matches_loop_implementation():
+    data = load_data('processed/BATS_QQQ_5min.csv')
+    strategy = run_vwma(data, runonce=False)
+    assert_same(calc_vwma(data['close'], data['volume'], PERIOD), strategy.loop_vwma.lines.vwma.array)
+
+
+# 长序列：分段累计和的误差只与段长有关
+def test_calc_vwma_long_history():
+    rng = np.random.default_rng(0)
+    n = 2_000_000
+    close = 400.0 * np.exp(np.cumsum(rng.normal(0.0, 2e-4, n)))
+    volume = rng.integers(1, 1_000_000, n).astype(np.float64)
+    assert_same(calc_vwma(close, volume, PERIOD), exact_vwma(close, volume, PERIOD))
+
+
+# 长序列：next() 的累计和跨过多次重新求和后仍与逐窗口求和一致
+def test_next_long_history():
+    data = pd.concat(generate(5 * VolumeWeightedMovingAverage.RESYNC_BARS, seed=1))
+    strategy = run_vwma(data, runonce=False, loop=False)
+    close = data['close'].to_numpy(dtype=np.float64)
+    volume = data['volume'].to_numpy(dtype=np.float64)
+    assert_same(strategy.vwma.lines.vwma.array, exact_vwma(close, volume, PERIOD))
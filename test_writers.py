@@ -0,0 +1,74 @@
+# test_writers.py
+# 分块写出的往返测试：小块写出的 CSV / 列式结果读回后与不分块的逐K线记录相同。
+# 前几块没有成交（数量为整数 0），之后出现小数数量，各块的列类型必须一致
+
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+import pytest
+from config import CONFIG
+from datastore import load_indicators
+from feeds import indicator_feed_class
+from indicators import indicator_column
+from main import run_strategy, strategy_specs
+from writers import TradeOutputWriter, read_columnar, filter_trades
+
+STRATEGY = 'SupertrendATR'
+TIMEFRAME = '240min'
+BARS = 1500
+CHUNK_SIZE = 7
+DATA_FILE = 'processed/BATS_QQQ_240min.csv'
+
+
+def run(trade_writer=None):
+    params = CONFIG['strategies'][STRATEGY]['params'][TIMEFRAME]
+    specs = strategy_specs(STRATEGY, params)
+    data = load_indicators(DATA_FILE, specs).iloc[:BARS]
+    feed = indicator_feed_class(tuple(indicator_column(spec) for spec in specs))(dataname=data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, results, _ = run_strategy(None, STRATEGY, params, data_feed=feed, trade_writer=trade_writer,
+                                     timeframe=TIMEFRAME)
+    return results[0].trade_recorder
+
+
+@pytest.fixture(scope='module')
+def expected():
+    df = run().get_analysis()
+    for column in ('交易数量', '当前持仓'):
+        df[column] = df[column].astype(np.float64)
+    return df
+
+
+def read_csv(path):
+    df = pd.read_csv(path, index_col=0, encoding='utf-8-sig', parse_dates=['时间'], float_precision='round_trip')
+    df['交易状态'] = pd.Categorical(df['交易状态'], categories=['无', '买', '加', '卖'])
+    return df
+
+
+@pytest.mark.parametrize('fmt', ['columnar', 'csv'])
+def test_chunked_round_trip(tmp_path, expected, fmt):
+    suffix = '' if fmt == 'columnar' else '.csv'
+    all_path, trades_path = str(tmp_path / f'all{suffix}'), str(tmp_path / f'trades{suffix}')
+    recorder = run(TradeOutputWriter(all_path, trades_path, STRATEGY, TIMEFRAME, chunk_size=CHUNK_SIZE, fmt=fmt))
+    recorder.close()
+
+    read = read_columnar if fmt == 'columnar' else read_csv
+    all_trades, trades = read(all_path), read(trades_path)
+    assert expected['交易数量'].to_numpy()[:CHUNK_SIZE].tolist() == [0.0] * CHUNK_SIZE
+    assert (expected['交易数量'] % 1 != 0).any()
+
+    columns = list(expected.columns)
+    pd.testing.assert_frame_equal(all_trades[columns], expected, check_dtype=False, check_index_type=False,
+                                  check_categorical=False)
+    expected_trades = filter_trades(expected)
+    assert trades.index.tolist() == list(range(1, len(expected_trades) + 1))
+    np.testing.assert_array_equal(trades['当前持仓'].to_numpy(), expected_trades['当前持仓'].to_numpy())
+    assert (all_trades['策略'] == STRATEGY).all()
+
+
+def test_columnar_rejects_dtype_change(tmp_path):
+    writer = TradeOutputWriter(str(tmp_path / 'all'), str(tmp_path / 'trades'), STRATEGY, TIMEFRAME, fmt='columnar')
+    writer.all_trades.write(pd.DataFrame({'当前持仓': np.zeros(3, dtype=np.int64)}))
+    with pytest.raises(ValueError):
+        writer.all_trades.write(pd.DataFrame({'当前持仓': np.full(3, 0.5)}))
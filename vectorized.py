@@ -0,0 +1,412 @@
+# vectorized.py
+# 纯 NumPy 的快速回测，适用于信号只依赖 close / VWMA / ATR / std 的全仓进出、只做多策略
+# （SupertrendATR、SupertrendSd、SupertrendMf），用于大批量参数筛选。
+# 撮合规则与 backtrader 默认经纪商一致：信号K线按 可用资金 / (close × (1 + friction_cost))
+# 计算数量，市价单在下一根K线开盘价成交；开盘价跳高导致资金不足时买单被拒绝（Margin）。
+# check_parity() 用同一组参数分别跑 backtrader 与本模块，核对成交与最终资金。
+# 批量模式（simulate_batch）：阈值参数（THRESHOLD_PARAMS，只出现在信号比较式中、不影响指标）可传入一组取值，
+# 指标只算一次，信号广播成 (K线数, 取值数) 的矩阵，各取值的现金、持仓各占数组的一列，
+# 只在有信号的K线上推进一次，所有取值同步撮合；结果与逐个 simulate 完全相同
+
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from strategy import StrategyFactory
+from indicators import calc_indicator
+import metrics
+
+SUPPORTED_STRATEGIES = ('SupertrendATR', 'SupertrendSd', 'SupertrendMf')
+# 只用于信号比较、可在批量模式中取一组值的参数
+THRESHOLD_PARAMS = {
+    'SupertrendATR': ('k',),
+    'SupertrendSd': ('k',),
+    'SupertrendMf': ('p', 'k'),
+}
+
+
+# 指标在 backtrader 中的最小周期，与 strategy.py 中各指标保持一致
+def indicator_minperiod(spec):
+    name, *args = spec
+    if name == 'vwma':
+        return args[0]
+    if name == 'atr':
+        return args[0] + 1
+    if name == 'std':
+        return max(args[1] or 2, 2)
+    raise ValueError(f"Unknown indicator: {name}")
+
+
+# 取指标列，cache 为 {spec: ndarray}，参数组合之间共享
+def get_indicator(data, spec, cache):
+    if cache is None:
+        return calc_indicator(data, spec)
+    if spec not in cache:
+        cache[spec] = calc_indicator(data, spec)
+    return cache[spec]
+
+
+# 计算整列的开仓/平仓信号，表达式与各策略 next() 中的判断一致。
+# 阈值参数为一维序列时返回 (K线数, 取值数) 的信号矩阵，每列对应一个取值
+def compute_signals(strategy_name, data, params, cache=None):
+    if strategy_name not in SUPPORTED_STRATEGIES:
+        raise ValueError(f"Strategy '{strategy_name}' has no vectorized implementation")
+
+    strategy_class = StrategyFactory.get_strategy(strategy_name)
+    specs = strategy_class.indicator_specs(params)
+    values = {spec[0]: get_indicator(data, spec, cache) for spec in specs}
+
+    close = data['close'].to_numpy(dtype=np.float64)
+    prev_close = np.concatenate(([np.nan], close[:-1]))
+
+    thresholds = {name: params[name] for name in THRESHOLD_PARAMS[strategy_name] if name in params}
+    if any(np.ndim(value) for value in thresholds.values()):
+        params = {**params, **{name: np.asarray(value, dtype=np.float64) for name, value in thresholds.items()}}
+        close, prev_close = close[:, None], prev_close[:, None]
+        values = {name: column[:, None] for name, column in values.items()}
+
+    with np.errstate(invalid='ignore'):
+        if strategy_name in ('SupertrendATR', 'SupertrendMf'):
+            p = params['k'] if strategy_name == 'SupertrendATR' else params['p']
+            atr_long = close < values['vwma'] - p * values['atr']
+            atr_short = close > values['vwma'] + p * values['atr']
+        if strategy_name in ('SupertrendSd', 'SupertrendMf'):
+            sd_long = close > prev_close + params['k'] * values['std']
+            sd_short = close < prev_close - params['k'] * values['std']
+
+    if strategy_name == 'SupertrendATR':
+        long_signal, short_signal = atr_long, atr_short
+    elif strategy_name == 'SupertrendSd':
+        long_signal, short_signal = sd_long, sd_short
+    else:
+        long_signal, short_signal = atr_long | sd_long, atr_short | sd_short
+
+    # 最小周期之前策略的 next() 不会被调用
+    start = max(indicator_minperiod(spec) for spec in specs) - 1
+    long_signal[:start] = False
+    short_signal[:start] = False
+    return long_signal, short_signal
+
+
+# 按信号推进持仓：只在成交事件上循环，资金与持仓曲线用切片整段填充
+def run_positions(open_, close, long_signal, short_signal, cash, friction_cost):
+    n = len(close)
+    long_index = np.flatnonzero(long_signal[:n - 1])   # 最后一根K线的订单不会成交
+    short_index = np.flatnonzero(short_signal[:n - 1])
+
+    cash_curve = np.full(n, float(cash))
+    size_curve = np.zeros(n)
+    trades = []
+    rejected = 0
+
+    bar = 0
+    while True:
+        # 空仓：找下一个能成交的开仓信号
+        j = np.searchsorted(long_index, bar, side='left')
+        entry = None
+        while j < len(long_index):
+            signal_bar = long_index[j]
+            j += 1
+            size = cash / (close[signal_bar] * (1 + friction_cost))
+            price = open_[signal_bar + 1]
+            if cash - abs(size) * price < 0.0:
+                rejected += 1
+                continue
+            entry = signal_bar
+            break
+        if entry is None:
+            break
+
+        fill_bar = entry + 1
+        entry_price = open_[fill_bar]
+        cash -= abs(size) * entry_price
+
+        # 持仓：成交当根起检查平仓信号
+        k = np.searchsorted(short_index, fill_bar, side='left')
+        if k == len(short_index):
+            cash_curve[fill_bar:] = cash
+            size_curve[fill_bar:] = size
+            trades.append((entry, fill_bar, entry_price, size, None, np.nan, np.nan, np.nan))
+            break
+
+        exit_bar = short_index[k] + 1
+        exit_price = open_[exit_bar]
+        cash_curve[fill_bar:exit_bar] = cash
+        size_curve[fill_bar:exit_bar] = size
+
+        pnl = size * (exit_price - entry_price)
+        cash += abs(size) * entry_price + pnl
+        cash_curve[exit_bar:] = cash
+        trades.append((entry, fill_bar, entry_price, size, exit_bar, exit_price, pnl, exit_bar - fill_bar))
+        bar = exit_bar
+
+    equity = cash_curve + size_curve * close
+    return trades, equity, rejected
+
+
+def max_drawdown(equity):
+    peak = np.maximum.accumulate(equity)
+    return float(np.max((peak - equity) / peak))
+
+
+# 批量推进持仓：信号为 (K线数, 取值数) 的矩阵，各列的现金、持仓、挂单是长度为取值数的数组。
+# 状态只在成交时变化，因此只在有信号的K线上循环：先撮合上一根信号K线的挂单（在其下一根K线开盘成交），
+# 再按本根K线的信号下单；每次成交后记下各列状态，最后按K线展开成逐K线总资产矩阵。
+# 返回 (总资产矩阵, 各列的交易统计)：已平仓交易数、盈利笔数、盈利总额、亏损总额、盈利交易的持仓K线数之和、被拒绝的订单数
+def run_positions_batch(open_, close, long_signal, short_signal, cash, friction_cost):
+    n, count = long_signal.shape
+    cash = np.full(count, float(cash))
+    size = np.zeros(count)
+    entry_price = np.zeros(count)
+    entry_bar = np.zeros(count, dtype=np.int64)
+    stats = {
+        'trades': np.zeros(count, dtype=np.int64),
+        'wins': np.zeros(count, dtype=np.int64),
+        'profit': np.zeros(count),
+        'loss': np.zeros(count),
+        'win_bars': np.zeros(count, dtype=np.int64),
+        'rejected': np.zeros(count, dtype=np.int64),
+    }
+    change_bars, cash_states, size_states = [0], [cash.copy()], [size.copy()]
+
+    def fill(bar, buy, sell, order_size):
+        price = open_[bar]
+        filled = buy & ~(cash - np.abs(order_size) * price < 0.0)
+        stats['rejected'][buy & ~filled] += 1
+        cash[filled] -= np.abs(order_size[filled]) * price
+        size[filled] = order_size[filled]
+        entry_price[filled] = price
+        entry_bar[filled] = bar
+
+        pnl = size[sell] * (price - entry_price[sell])
+        cash[sell] += np.abs(size[sell]) * entry_price[sell] + pnl
+        size[sell] = 0.0
+        # 与 metrics.trade_stats 相同：盈亏为 0 的交易计入亏损
+        win = pnl > 0
+        stats['trades'][sell] += 1
+        stats['wins'][sell] += win
+        stats['profit'][sell] += np.where(win, pnl, 0.0)
+        stats['loss'][sell] -= np.where(win, 0.0, pnl)
+        stats['win_bars'][sell] += np.where(win, bar - entry_bar[sell], 0)
+
+        change_bars.append(bar)
+        cash_states.append(cash.copy())
+        size_states.append(size.copy())
+
+    # 最后一根K线的订单不会成交
+    any_long = long_signal[:n - 1].any(axis=1)
+    any_short = short_signal[:n - 1].any(axis=1)
+    signal_bars = np.flatnonzero(any_long | any_short).tolist()
+    any_long, any_short = any_long.tolist(), any_short.tolist()
+
+    pending = None
+    flat = np.ones(count, dtype=bool)
+    has_flat, has_position = True, False
+    for bar in signal_bars:
+        if pending is not None:
+            fill(*pending)
+            pending = None
+            flat = size == 0.0
+            has_flat, has_position = flat.any(), not flat.all()
+        # 全部空仓时的平仓信号、全部持仓时的开仓信号都不会下单，跳过
+        if not (any_long[bar] and has_flat or any_short[bar] and has_position):
+            continue
+        # 空仓且有开仓信号的列下买单，持仓且有平仓信号的列下卖单
+        buy = flat & long_signal[bar]
+        sell = ~flat & short_signal[bar]
+        if buy.any() or sell.any():
+            pending = (bar + 1, buy, sell, cash / (close[bar] * (1 + friction_cost)))
+    if pending is not None:
+        fill(*pending)
+
+    state = np.searchsorted(change_bars, np.arange(n), side='right') - 1
+    equity = np.asarray(cash_states)[state] + np.asarray(size_states)[state] * close[:, None]
+    return equity, stats
+
+
+# 对一组参数做向量化回测，返回成交表、逐K线总资产与主要指标
+def simulate(strategy_name, data, params, cache=None, initial_cash=None, friction_cost=None):
+    initial_cash = CONFIG['initial_cash'] if initial_cash is None else initial_cash
+    friction_cost = CONFIG['friction_cost'] if friction_cost is None else friction_cost
+
+    long_signal, short_signal = compute_signals(strategy_name, data, params, cache)
+    open_ = data['open'].to_numpy(dtype=np.float64)
+    close = data['close'].to_numpy(dtype=np.float64)
+    trades, equity, rejected = run_positions(open_, close, long_signal, short_signal,
+                                             initial_cash, friction_cost)
+
+    index = data.index
+    trade_table = pd.DataFrame([{
+        '开仓信号时间': index[entry],
+        '开仓时间': index[fill_bar],
+        '开仓价格': entry_price,
+        '数量': size,
+        '平仓时间': index[exit_bar] if exit_bar is not None else pd.NaT,
+        '平仓价格': exit_price,
+        '盈亏': pnl,
+        '持仓K线根数': barlen,
+    } for entry, fill_bar, entry_price, size, exit_bar, exit_price, pnl, barlen in trades])
+
+    num_years = (index[-1].date() - index[0].date()).days / 365.25
+    final_value = float(equity[-1])
+    roi = final_value / initial_cash - 1.0
+    closed = [trade[6] for trade in trades if trade[4] is not None]
+
+    return {
+        'trades': trade_table,
+        'equity': equity,
+        'final_value': final_value,
+        'roi': roi,
+        'annualized_roi': (1.0 + roi) ** (1 / num_years) - 1.0,
+        'max_drawdown': max_drawdown(equity),
+        'total_trades': len(closed),
+        'win_rate': sum(pnl > 0 for pnl in closed) / len(closed) if closed else 0,
+        'rejected_orders': rejected,
+    }
+
+
+# 批量回测一组阈值参数取值：params 中 THRESHOLD_PARAMS 的参数可为等长序列（多个时按位置配对），其余为标量。
+# 返回各取值的指标数组与逐K线总资产矩阵 (K线数, 取值数)；交易统计的口径与 metrics.trade_stats 相同
+def simulate_batch(strategy_name, data, params, cache=None, initial_cash=None, friction_cost=None):
+    initial_cash = CONFIG['initial_cash'] if initial_cash is None else initial_cash
+    friction_cost = CONFIG['friction_cost'] if friction_cost is None else friction_cost
+
+    long_signal, short_signal = compute_signals(strategy_name, data, params, cache)
+    if long_signal.ndim == 1:
+        long_signal, short_signal = long_signal[:, None], short_signal[:, None]
+    open_ = data['open'].to_numpy(dtype=np.float64)
+    close = data['close'].to_numpy(dtype=np.float64)
+    equity, stats = run_positions_batch(open_, close, long_signal, short_signal, initial_cash, friction_cost)
+    trades, wins = stats['trades'], stats['wins']
+
+    index = data.index
+    num_years = (index[-1].date() - index[0].date()).days / 365.25
+    final_value = equity[-1]
+    roi = final_value / initial_cash - 1.0
+    peak = np.maximum.accumulate(equity, axis=0)
+
+    return {
+        'equity': equity,
+        'final_value': final_value,
+        'roi': roi,
+        'annualized_roi': (1.0 + roi) ** (1 / num_years) - 1.0,
+        'max_drawdown': np.max((peak - equity) / peak, axis=0),
+        'total_trades': trades,
+        'win_rate': np.divide(wins, trades, out=np.zeros(len(trades)), where=trades > 0),
+        'annual_trade_count': trades / num_years if num_years > 0 else trades.astype(np.float64),
+        'profit_factor': np.divide(stats['profit'], stats['loss'], out=np.full(len(trades), np.inf),
+                                   where=stats['loss'] != 0),
+        'avg_winning_trade_bars': np.divide(stats['win_bars'], wins, out=np.zeros(len(trades)), where=wins > 0),
+        'rejected_orders': stats['rejected'],
+    }
+
+
+# 与 main.get_metrics 相同键名的指标：资金曲线类指标对第 column 列调用 metrics.py 中的函数，
+# 交易统计取 simulate_batch 的累计值。两种寻优引擎的结果表列相同，数值只差舍入误差
+# （平价平仓的交易盈亏在 0 附近，胜率等交易统计可能因此差一笔）
+def batch_metrics(result, index, initial_cash, column):
+    equity = result['equity'][:, column]
+    num_years = metrics.years_between(index)
+    bars_per_year = len(equity) / num_years if num_years > 0 else len(equity)
+    drawdown = metrics.max_drawdown(equity, index.date)
+    stats = metrics.return_stats(metrics.bar_returns(equity, initial_cash), bars_per_year)
+    return {
+        "总收益率": float(result['roi'][column]),
+        "年化收益率": float(result['annualized_roi'][column]),
+        "最大回撤": drawdown['drawdown'],
+        "夏普比率": metrics.annual_sharpe(equity, index, initial_cash),
+        "年均交易次数": float(result['annual_trade_count'][column]),
+        "胜率": float(result['win_rate'][column]),
+        "盈亏比": float(result['profit_factor'][column]),
+        "最大回撤持续K线根数": drawdown['len'],
+        "最大回撤开始时间": drawdown['datetime'],
+        "最大回撤结束时间": drawdown['recovery'],
+        "盈利交易的平均持仓K线根数": float(result['avg_winning_trade_bars'][column]),
+        "索提诺比率": stats['sortino'],
+        "年化波动率": stats['volatility'],
+    }
+
+
+# 批量筛选参数：只有阈值参数不同的组合归为一组，每组调用一次 simulate_batch；各组共享指标缓存。
+# 结果表每行一组参数，顺序与 param_list 相同，指标列与 backtrader 引擎（main.get_metrics 加最终资金）相同
+def screen(strategy_name, data, param_list):
+    thresholds = THRESHOLD_PARAMS[strategy_name]
+    groups = {}
+    for position, params in enumerate(param_list):
+        key = tuple(sorted((name, value) for name, value in params.items() if name not in thresholds))
+        groups.setdefault(key, []).append(position)
+
+    cache = {}
+    rows = [None] * len(param_list)
+    for positions in groups.values():
+        members = [param_list[position] for position in positions]
+        batch = {**members[0], **{name: [params[name] for params in members]
+                                  for name in thresholds if name in members[0]}}
+        result = simulate_batch(strategy_name, data, batch, cache)
+        for i, (position, params) in enumerate(zip(positions, members)):
+            rows[position] = {
+                **params,
+                **batch_metrics(result, data.index, CONFIG['initial_cash'], i),
+                '最终资金': float(result['final_value'][i]),
+            }
+    return pd.DataFrame(rows)
+
+
+# 对照 backtrader 的回测结果：逐笔核对成交价格与数量、逐K线核对总资产、核对最终资金
+def check_parity(strategy_name, timeframe, params=None, rtol=1e-9):
+    from main import run_strategy, load_data
+    from resample import resolve_data_file
+
+    data_file = resolve_data_file(timeframe)
+    if params is None:
+        params = CONFIG['strategies'][strategy_name]['params'][timeframe]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cerebro, results, num_years = run_strategy(data_file, strategy_name, params, timeframe=timeframe)
+    recorded = results[0].trade_recorder.get_analysis()
+    fast = simulate(strategy_name, load_data(data_file), params)
+
+    fills = recorded[recorded['交易状态'].isin(['买', '卖'])]
+    expected_fills = []
+    for trade in fast['trades'].itertuples(index=False):
+        expected_fills.append((trade.开仓价格, trade.数量))
+        if not pd.isna(trade.平仓时间):
+            expected_fills.append((trade.平仓价格, -trade.数量))
+    expected = np.array(expected_fills).reshape(-1, 2)
+    actual = fills[['交易价格', '交易数量']].to_numpy()
+
+    trades_match = expected.shape == actual.shape and np.allclose(expected, actual, rtol=rtol, atol=0)
+
+    # 每根K线在 next() 中记录一行“无”，对应本模块的逐K线总资产
+    bar_assets = recorded.loc[recorded['交易状态'] == '无', '总资产'].to_numpy()
+    equity = fast['equity'][-len(bar_assets):]
+    equity_match = np.allclose(bar_assets, equity, rtol=rtol, atol=0)
+
+    bt_value = cerebro.broker.get_value()
+    return {
+        'strategy': strategy_name,
+        'timeframe': timeframe,
+        'backtrader_final_value': bt_value,
+        'vectorized_final_value': fast['final_value'],
+        'final_value_match': bool(np.isclose(bt_value, fast['final_value'], rtol=rtol, atol=0)),
+        'trades_match': bool(trades_match),
+        'equity_match': bool(equity_match),
+        'fills': len(actual),
+    }
+
+
+def main():
+    for strategy_name, strategy_config in CONFIG['strategies'].items():
+        if strategy_name not in SUPPORTED_STRATEGIES:
+            continue
+        for timeframe in strategy_config['enabled_timeframes']:
+            report = check_parity(strategy_name, timeframe)
+            status = '一致' if report['final_value_match'] and report['trades_match'] and report['equity_match'] else '不一致'
+            print(f"{strategy_name} {timeframe}: {status}  "
+                  f"backtrader {report['backtrader_final_value']:.2f} / 向量化 {report['vectorized_final_value']:.2f}  "
+                  f"成交 {report['fills']} 笔")
+
+
+if __name__ == '__main__':
+    main()
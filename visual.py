@@ -5,34 +5,82 @@ import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
 import os
+import re
+from functools import lru_cache
+import numpy as np
 from config import *
+from downsample import downsample_ohlc, downsample_line
 
 app = dash.Dash(__name__)
 
 # 定义数据目录
 DATA_DIR = CONFIG['df_dir']
 
+# 已解析的数据按 (文件路径, 修改时间) 缓存，文件被重新生成后自动重新读取；
+# 返回的 DataFrame 为共享对象，调用方不要原地修改
+@lru_cache(maxsize=CONFIG['visualization'].get('cache_size', 16))
+def read_trades_file(file_path, mtime_ns):
+    df = pd.read_csv(file_path)
+    df['时间'] = pd.to_datetime(df['时间'])
+    return df
+
 def load_data(strategy, timeframe, target):
     filename = f"{strategy}_{timeframe}_{target}_all_trades.csv"
     file_path = os.path.join(DATA_DIR, filename)
     if os.path.exists(file_path):
-        df = pd.read_csv(file_path)
-        df['时间'] = pd.to_datetime(df['时间'])
-        return df
+        return read_trades_file(file_path, os.stat(file_path).st_mtime_ns)
     else:
         return pd.DataFrame()  # 返回空DataFrame如果文件不存在
 
-def create_figure(strategy_df, benchmark_df, timeframe, strategy, benchmark, target):
+# 从 relayoutData 中取出当前可见的时间范围；自动范围（双击、All 按钮）或没有范围信息时返回 None。
+# 三个子图共享x轴，缩放任一子图都会给出 xaxis / xaxis2 / xaxis3 的范围
+def visible_range(relayout_data):
+    if not relayout_data:
+        return None
+    for key, value in relayout_data.items():
+        if re.fullmatch(r'xaxis\d*\.autorange', key) and value:
+            return None
+    for key, value in relayout_data.items():
+        match = re.fullmatch(r'(xaxis\d*)\.range\[0\]', key)
+        if match and f'{match.group(1)}.range[1]' in relayout_data:
+            return pd.Timestamp(value), pd.Timestamp(relayout_data[f'{match.group(1)}.range[1]'])
+        if re.fullmatch(r'xaxis\d*\.range', key):
+            return pd.Timestamp(value[0]), pd.Timestamp(value[1])
+    return None
+
+# 只取可见范围内的行，两侧各多取 margin 倍窗口长度，小幅平移时不会露出空白；
+# 数据按时间排序，用二分查找定位切片边界
+def slice_range(df, x_range, margin=None):
+    if x_range is None or df.empty:
+        return df
+    if margin is None:
+        margin = CONFIG['visualization'].get('range_margin', 0.5)
+    start, end = x_range
+    pad = (end - start) * margin
+    times = df['时间'].to_numpy()
+    lo = np.searchsorted(times, np.datetime64(start - pad), side='left')
+    hi = np.searchsorted(times, np.datetime64(end + pad), side='right')
+    return df.iloc[lo:hi]
+
+def create_figure(strategy_df, benchmark_df, timeframe, strategy, benchmark, target, x_range=None):
     fig = make_subplots(rows=3, cols=1, shared_xaxes=True,
                         vertical_spacing=0.1, 
                         row_heights=[0.5, 0.25, 0.25],
                         subplot_titles=('交易信号图', '总资金曲线', '资金利用率'))
 
-    fig.add_trace(go.Candlestick(x=strategy_df['时间'],
-                                 open=strategy_df['open'],
-                                 high=strategy_df['high'],
-                                 low=strategy_df['low'],
-                                 close=strategy_df['close'],
+    # K线与曲线按当前范围降采样到固定点数，交易标记仍取自完整数据
+    max_points = CONFIG['visualization'].get('max_points')
+    line_method = CONFIG['visualization'].get('line_downsample', 'lttb')
+    candles = downsample_ohlc(strategy_df, max_points)
+    strategy_equity = downsample_line(strategy_df, '总资产', max_points, line_method)
+    benchmark_equity = downsample_line(benchmark_df, '总资产', max_points, line_method)
+    utilization = downsample_line(strategy_df, '资金利用率', max_points, line_method)
+
+    fig.add_trace(go.Candlestick(x=candles['时间'],
+                                 open=candles['open'],
+                                 high=candles['high'],
+                                 low=candles['low'],
+                                 close=candles['close'],
                                  name='交易曲线'),
                   row=1, col=1)
 
@@ -52,15 +100,15 @@ def create_figure(strategy_df, benchmark_df, timeframe, strategy, benchmark, tar
                              marker=dict(symbol='triangle-down', size=15, color='red', line=dict(color='darkred', width=2)),
                              name='平仓信号'), row=1, col=1)
 
-    fig.add_trace(go.Scatter(x=strategy_df['时间'], y=strategy_df['总资产'], mode='lines+markers', 
+    fig.add_trace(go.Scatter(x=strategy_equity['时间'], y=strategy_equity['总资产'], mode='lines+markers', 
                              name=f'{strategy} 资金曲线', marker=dict(color='red', size=1)),
                   row=2, col=1)
 
-    fig.add_trace(go.Scatter(x=benchmark_df['时间'], y=benchmark_df['总资产'], mode='lines+markers', 
+    fig.add_trace(go.Scatter(x=benchmark_equity['时间'], y=benchmark_equity['总资产'], mode='lines+markers', 
                              name=f'{benchmark} 资金曲线', marker=dict(color='grey', size=1)),
                   row=2, col=1)
 
-    fig.add_trace(go.Scatter(x=strategy_df['时间'], y=strategy_df['资金利用率'], mode='markers', 
+    fig.add_trace(go.Scatter(x=utilization['时间'], y=utilization['资金利用率'], mode='markers', 
                          name='资金利用率', marker=dict(color='orange', size=1)),
                   row=3, col=1)
 
@@ -88,9 +136,12 @@ def create_figure(strategy_df, benchmark_df, timeframe, strategy, benchmark, tar
     fig.update_yaxes(title_text="资产", row=2, col=1)
     fig.update_yaxes(title_text="资金利用率", row=3, col=1)
 
-    # 获取数据的时间范围
-    date_min = strategy_df['时间'].min()
-    date_max = strategy_df['时间'].max()
+    # 获取数据的时间范围；按可见范围取数时保持当前可见范围
+    if x_range is not None:
+        date_min, date_max = x_range
+    else:
+        date_min = strategy_df['时间'].min()
+        date_max = strategy_df['时间'].max()
 
     fig.update_layout(
         height=1400,
@@ -117,7 +168,8 @@ def create_figure(strategy_df, benchmark_df, timeframe, strategy, benchmark, tar
         legend=dict(x=1.05, y=0.5),
         margin=dict(l=50, r=50, t=80, b=50),
         autosize=True,
-        uirevision='dataset'
+        # 切换数据集时重置视图，同一数据集内缩放、平移保持不变
+        uirevision=f'{strategy}-{timeframe}-{benchmark}-{target}'
     )
 
     return fig
@@ -195,17 +247,24 @@ app.layout = html.Div([
     [Input('strategy-dropdown', 'value'),
      Input('timeframe-dropdown', 'value'),
      Input('benchmark-dropdown', 'value'),
-     Input('target-dropdown', 'value')]
+     Input('target-dropdown', 'value'),
+     Input('strategy-graph', 'relayoutData')]
 )
-def update_graph_and_title(strategy, timeframe, benchmark, target):
+def update_graph_and_title(strategy, timeframe, benchmark, target, relayout_data):
     strategy_df = load_data(strategy, timeframe, target)
     benchmark_df = load_data(benchmark, timeframe, target)
     
     if strategy_df.empty or benchmark_df.empty:
         print("No data available for the selected parameters")
         return go.Figure().add_annotation(text="No data available", showarrow=False, font=dict(size=20)), "No Data Available"
+
+    # 只有缩放 / 平移触发时才按可见范围取数，切换下拉框时显示全部数据
+    triggered = [item['prop_id'] for item in dash.callback_context.triggered]
+    x_range = visible_range(relayout_data) if 'strategy-graph.relayoutData' in triggered else None
+    strategy_df = slice_range(strategy_df, x_range)
+    benchmark_df = slice_range(benchmark_df, x_range)
     
-    figure = create_figure(strategy_df, benchmark_df, timeframe, strategy, benchmark, target)
+    figure = create_figure(strategy_df, benchmark_df, timeframe, strategy, benchmark, target, x_range)
     title = f'Visualisation - {strategy} vs {benchmark} - {timeframe} - {target}'
     
     return figure, title
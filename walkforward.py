@@ -0,0 +1,196 @@
+# walkforward.py
+# 滚动窗口（walk-forward）回测：把数据切成连续的 样本内 / 样本外 窗口，
+# 在样本内窗口上寻优，用最优参数回测紧随其后的样本外窗口，再把各样本外资金曲线首尾相接。
+# 数据只在主进程加载一次并放入共享内存，各窗口在子进程中按行号切片，并行运行。
+# 样本外回测使用在此前全部数据上预计算的指标列，并在窗口前带上 minperiod-1 根预热K线，
+# 策略在样本外第一根K线即可交易，指标取值与一次连续回测相同（expanding std 不会在窗口处重新开始）
+
+import os
+import io
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from strategy import StrategyFactory
+from feeds import share_data, attach_data, indicator_feed_class
+from indicators import precompute_indicators, indicator_column
+from optimize import sample_params, group_params, evaluate_params, ASCENDING_METRICS
+from main import run_strategy, load_data, ensure_dir
+from metrics import analyze
+from resample import resolve_data_file
+from vectorized import indicator_minperiod
+
+
+# 划分窗口：返回 (样本内起点, 样本外起点, 样本外终点) 行号，步长默认等于样本外长度。
+# 末尾不足 out_of_sample 根的样本外窗口并入上一个窗口；没有上一个窗口时，不足 min_bars 根则不回测
+def split_windows(rows, in_sample, out_of_sample, step=None, min_bars=1):
+    step = step or out_of_sample
+    windows = []
+    start = 0
+    while start + in_sample < rows:
+        oos_start = start + in_sample
+        oos_end = min(oos_start + out_of_sample, rows)
+        if oos_end - oos_start < out_of_sample:
+            if windows:
+                windows[-1] = (*windows[-1][:2], rows)
+            elif oos_end - oos_start >= min_bars:
+                windows.append((start, oos_start, oos_end))
+            break
+        windows.append((start, oos_start, oos_end))
+        start += step
+    return windows
+
+
+# 策略达到最小周期所需的K线数：各指标最小周期中的最大值
+def strategy_minperiod(strategy_class, params):
+    specs = strategy_class.indicator_specs({**strategy_class.params._getpairs(), **params})
+    return max((indicator_minperiod(spec) for spec in specs), default=1)
+
+
+# 从逐K线记录中取每根K线收盘后的总资产，指标预热期内没有记录，按初始资金补齐
+def equity_curve(recorder_df, index, initial_cash=None):
+    equity = recorder_df.groupby('时间')['总资产'].last()
+    equity.index = pd.DatetimeIndex(equity.index)
+    return equity.reindex(index).ffill().fillna(CONFIG['initial_cash'] if initial_cash is None else initial_cash)
+
+
+# 单个窗口：样本内寻优，样本外用最优参数回测
+def run_window(task):
+    strategy_name, data_file, timeframe, shared, window, param_list, sort_by = task
+    is_start, oos_start, oos_end = window
+    strategy_class = StrategyFactory.get_strategy(strategy_name)
+
+    shm, data = attach_data(shared)
+    in_sample = data.iloc[is_start:oos_start]
+    out_of_sample = data.iloc[oos_start:oos_end]
+
+    rows = []
+    for specs, members in group_params(strategy_class, param_list, 1):
+        rows += evaluate_params(strategy_name, data_file, timeframe, in_sample, specs, members)
+    scores = pd.Series([row[sort_by] for row in rows], dtype=float)
+    best = rows[scores.idxmin() if sort_by in ASCENDING_METRICS else scores.idxmax()]
+    best_params = {name: best[name] for name in param_list[0]}
+
+    # 指标在样本外终点之前的全部数据上计算，预热K线只用于让策略达到最小周期，其间不会下单
+    specs = strategy_class.indicator_specs({**strategy_class.params._getpairs(), **best_params})
+    warmup = min(strategy_minperiod(strategy_class, best_params) - 1, oos_start)
+    history = precompute_indicators(data.iloc[:oos_end], specs)
+    feed_class = indicator_feed_class(tuple(indicator_column(spec) for spec in specs))
+    with contextlib.redirect_stdout(io.StringIO()):
+        cerebro, results, num_years = run_strategy(data_file, strategy_name, best_params,
+                                                   data_feed=feed_class(dataname=history.iloc[oos_start - warmup:]),
+                                                   timeframe=timeframe)
+    # 指标与资金曲线只取样本外部分
+    records = results[0].trade_recorder.get_analysis()
+    metrics, _, _ = analyze(records, out_of_sample.index, CONFIG['initial_cash'])
+    equity = equity_curve(records, out_of_sample.index)
+
+    summary = {
+        '样本内开始': in_sample.index[0],
+        '样本外开始': out_of_sample.index[0],
+        '样本外结束': out_of_sample.index[-1],
+        **{f'最优_{name}': value for name, value in best_params.items()},
+        f'样本内{sort_by}': best[sort_by],
+        '样本外总收益率': metrics['总收益率'],
+        '样本外最大回撤': metrics['最大回撤'],
+        '样本外夏普比率': metrics['夏普比率'],
+        '样本外胜率': metrics['胜率'],
+    }
+    return summary, equity
+
+
+# 把各窗口的样本外资金曲线首尾相接：每段按上一段的期末资金等比缩放；
+# 步长小于样本外长度时窗口重叠，每段截到下一段开始之前
+def stitch_equity(curves):
+    stitched = []
+    scale = 1.0
+    for i, equity in enumerate(curves):
+        if i + 1 < len(curves):
+            equity = equity[equity.index < curves[i + 1].index[0]]
+        scaled = equity * scale
+        stitched.append(scaled)
+        scale = scaled.iloc[-1] / CONFIG['initial_cash']
+    return pd.concat(stitched)
+
+
+# 拼接后资金曲线的汇总指标
+def aggregate_stats(stitched):
+    values = stitched.to_numpy()
+    peak = np.maximum.accumulate(values)
+    num_years = (stitched.index[-1].date() - stitched.index[0].date()).days / 365.25
+    roi = float(values[-1] / CONFIG['initial_cash'] - 1.0)
+    return {
+        '总收益率': roi,
+        '年化收益率': (1.0 + roi) ** (1 / num_years) - 1.0 if num_years > 0 else 0,
+        '最大回撤': float(np.max((peak - values) / peak)),
+        '样本外年数': num_years,
+    }
+
+
+def walk_forward(strategy_name, timeframe, space, in_sample, out_of_sample, step=None,
+                 method='grid', samples=None, seed=None, sort_by='年化收益率', workers=None):
+    data_file = resolve_data_file(timeframe)
+    base_params = (CONFIG['strategies'][strategy_name]['params'] or {}).get(timeframe, {})
+    param_list = [{**base_params, **combo} for combo in sample_params(space, method, samples, seed)]
+
+    if workers is None:
+        workers = CONFIG['workers']
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    data = load_data(data_file)
+    strategy_class = StrategyFactory.get_strategy(strategy_name)
+    min_bars = max(strategy_minperiod(strategy_class, params) for params in param_list)
+    windows = split_windows(len(data), in_sample, out_of_sample, step, min_bars)
+    if not windows:
+        raise ValueError(f"Not enough data for walk-forward: {len(data)} rows, "
+                         f"in_sample={in_sample}, out_of_sample={out_of_sample}")
+    print(f"窗口数: {len(windows)}，每个样本内窗口的参数组合: {len(param_list)} 个")
+
+    shm, shared = share_data(data)
+    try:
+        tasks = [(strategy_name, data_file, timeframe, shared, window, param_list, sort_by) for window in windows]
+        if workers == 1 or len(tasks) <= 1:
+            outputs = [run_window(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                outputs = list(executor.map(run_window, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    table = pd.DataFrame([summary for summary, _ in outputs])
+    table.index = table.index + 1
+    table.index.name = '窗口'
+    stitched = stitch_equity([equity for _, equity in outputs])
+    return table, stitched, aggregate_stats(stitched)
+
+
+def main():
+    settings = CONFIG['walk_forward']
+    strategy_name = settings['strategy']
+    timeframe = settings['timeframe']
+
+    table, stitched, stats = walk_forward(
+        strategy_name, timeframe, settings['params'],
+        in_sample=settings['in_sample'], out_of_sample=settings['out_of_sample'],
+        step=settings.get('step'), method=settings['method'], samples=settings.get('samples'),
+        seed=settings.get('seed'), sort_by=settings['sort_by'])
+
+    output_file = f"{CONFIG['output_dir']}walkforward_{strategy_name}_{timeframe}.csv"
+    equity_file = f"{CONFIG['output_dir']}walkforward_{strategy_name}_{timeframe}_equity.csv"
+    ensure_dir(output_file)
+    table.to_csv(output_file, encoding='utf-8-sig')
+    stitched.rename('总资产').to_csv(equity_file, encoding='utf-8-sig')
+
+    print(table.to_string())
+    print("\n样本外汇总：")
+    for key, value in stats.items():
+        print(f"    {key}: {value:.4f}")
+    print(f"\n窗口结果已保存到: {output_file}")
+    print(f"拼接后的样本外资金曲线已保存到: {equity_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# writers.py
+# 分块写出回测记录：TradeRecorder 每攒满一块就写入磁盘并清空缓冲，内存占用与回测长度无关。
+# 支持 CSV 与二进制列式两种格式；列式格式每列一个原始二进制文件，读取时内存映射
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+TRADE_STATES = ['买', '加', '卖']
+TRADE_DROP_COLUMNS = ['open', 'high', 'low', 'close', '资金利用率']
+
+
+# 从逐K线记录中筛出有成交的行，作为交易记录
+def filter_trades(df):
+    filtered_df = df[df['交易状态'].isin(TRADE_STATES)]
+    return filtered_df.drop(columns=TRADE_DROP_COLUMNS, errors='ignore')
+
+
+# 按块追加写入 CSV；行号在各块之间连续，constants 作为常量列追加在末尾
+class CsvChunkWriter:
+    def __init__(self, path, constants=None, index_start=0):
+        self.path = path
+        self.constants = constants or {}
+        self.index_start = index_start
+        self.rows = 0
+        self.started = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        df = df.copy(deep=False)
+        df.index = pd.RangeIndex(self.index_start + self.rows, self.index_start + self.rows + len(df))
+        for column, value in self.constants.items():
+            df[column] = value
+
+        first = not self.started
+        # 表头与 BOM 只在文件开头写一次
+        df.to_csv(self.path, mode='w' if first else 'a', header=first,
+                  encoding='utf-8-sig' if first else 'utf-8')
+        self.rows += len(df)
+        self.started = True
+
+    def close(self):
+        pass
+
+
+# 按块追加写入二进制列式目录：<列序号>.bin 存原始数值，meta.json 记录列名、类型、分类标签与行数；
+# 时间列存为 int64 微秒，分类列存为 int8 编码，constants 只记录在元数据中
+class ColumnarChunkWriter:
+    def __init__(self, directory, constants=None, index_start=0):
+        self.directory = directory
+        self.meta = {'rows': 0, 'index_start': index_start, 'columns': [], 'constants': constants or {}}
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+
+    def column_file(self, i):
+        return os.path.join(self.directory, f'{i}.bin')
+
+    def write(self, df):
+        first = not self.meta['columns']
+        for i, column in enumerate(df.columns):
+            series = df[column]
+            entry = {'name': column}
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values = series.cat.codes.to_numpy()
+                entry['categories'] = list(series.cat.categories)
+            elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+                values = series.to_numpy().astype('datetime64[us]').view(np.int64)
+                entry['datetime'] = True
+            else:
+                values = series.to_numpy()
+            entry['dtype'] = values.dtype.str
+
+            if first:
+                self.meta['columns'].append(entry)
+            elif self.meta['columns'][i]['dtype'] != entry['dtype']:
+                # 各块按原始字节拼接，类型必须与第一块相同
+                raise ValueError(f"Column '{column}' dtype changed between chunks: "
+                                 f"{self.meta['columns'][i]['dtype']} -> {entry['dtype']}")
+            with open(self.column_file(i), 'ab') as f:
+                f.write(np.ascontiguousarray(values).tobytes())
+
+        self.meta['rows'] += len(df)
+
+    def close(self):
+        with open(os.path.join(self.directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+
+# 读取列式目录，数值列以只读内存映射方式打开
+def read_columnar(directory):
+    with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    rows = meta['rows']
+    columns = {}
+    for i, entry in enumerate(meta['columns']):
+        path = os.path.join(directory, f'{i}.bin')
+        values = np.memmap(path, dtype=entry['dtype'], mode='r', shape=(rows,)) if rows else np.empty(0, entry['dtype'])
+        values = np.asarray(values)
+        if 'categories' in entry:
+            values = pd.Categorical.from_codes(values, categories=entry['categories'])
+        elif entry.get('datetime'):
+            values = values.view('datetime64[us]')
+        columns[entry['name']] = values
+
+    index = pd.RangeIndex(meta['index_start'], meta['index_start'] + rows)
+    df = pd.DataFrame(columns, index=index, copy=False)
+    for column, value in meta['constants'].items():
+        df[column] = value
+    return df
+
+
+WRITERS = {
+    'csv': CsvChunkWriter,
+    'columnar': ColumnarChunkWriter,
+}
+
+
+# 同时写出可视化数据（全部记录）与交易记录（仅成交行，行号从1开始）
+class TradeOutputWriter:
+    def __init__(self, all_trades_path, trades_path, strategy_name, timeframe,
+                 chunk_size=50000, fmt='csv'):
+        if fmt not in WRITERS:
+            raise ValueError(f"Unsupported output format: {fmt}")
+
+        writer_class = WRITERS[fmt]
+        constants = {'策略': strategy_name, '时间框架': timeframe}
+        self.chunk_size = chunk_size
+        self.all_trades = writer_class(all_trades_path, constants)
+        self.trades = writer_class(trades_path, constants, index_start=1)
+
+    def write(self, df):
+        self.all_trades.write(df)
+        self.trades.write(filter_trades(df))
+
+    def close(self):
+        self.all_trades.close()
+        self.trades.close()